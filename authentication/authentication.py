@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+# The fields the API reads from request.user; anything else is loaded from
+# the database on first access, like a deferred field of .only().
+CACHED_USER_FIELDS = ("id", "email", "is_active", "is_verified")
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def get_user_cache():
+    return caches[settings.AUTH_USER_CACHE_ALIAS]
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    # JWTAuthentication with the user lookup cached for
+    # AUTH_USER_CACHE_TIMEOUT seconds, so an authenticated request does not
+    # cost a primary-key query. The cache is shared by the worker processes
+    # and the entry is dropped whenever the user is saved or deleted.
+
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Needs the password hash, which is not cached.
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        cache = get_user_cache()
+        key = user_cache_key(user_id)
+        values = cache.get(key)
+        if values is None:
+            values = (
+                self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                .values(*CACHED_USER_FIELDS)
+                .first()
+            )
+            if values is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(key, values, settings.AUTH_USER_CACHE_TIMEOUT)
+
+        # from_db() takes the values in the model's field order.
+        fields = [field.attname for field in self.user_model._meta.concrete_fields if field.attname in values]
+        user = self.user_model.from_db(
+            router.db_for_read(self.user_model), fields, [values[field] for field in fields],
+        )
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
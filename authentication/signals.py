@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import get_user_cache, user_cache_key
+from .models import UserModel
+
+
+@receiver([post_save, post_delete], sender=UserModel)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # After commit, otherwise a concurrent request could cache the old row
+    # again before the change is visible.
+    key = user_cache_key(instance.pk)
+    transaction.on_commit(lambda: get_user_cache().delete(key))
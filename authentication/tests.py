@@ -1,3 +1,29 @@
 from django.test import TestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from .authentication import CachedJWTAuthentication, get_user_cache, user_cache_key
+from .models import UserModel
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = UserModel.objects.create_user(email="reader@example.com", is_verified=True)
+        self.token = AccessToken.for_user(self.user)
+        self.addCleanup(get_user_cache().delete, user_cache_key(self.user.pk))
+
+    def test_second_lookup_is_served_from_cache(self):
+        authentication = CachedJWTAuthentication()
+        authentication.get_user(self.token)
+        with self.assertNumQueries(0):
+            user = authentication.get_user(self.token)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.email, "reader@example.com")
+        self.assertTrue(user.is_verified)
+
+    def test_save_drops_cached_user(self):
+        authentication = CachedJWTAuthentication()
+        authentication.get_user(self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_verified = False
+            self.user.save()
+        self.assertFalse(authentication.get_user(self.token).is_verified)
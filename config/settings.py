@@ -48,6 +48,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Custom apps
     'authentication',
     'library',
@@ -62,6 +63,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.MetricsMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -108,6 +110,21 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Shared by all worker processes on the host, so catalog invalidation
+    # reaches every worker without an external cache service.
+    "library": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": env("LIBRARY_CACHE_DIR", default=os.path.join(BASE_DIR, "cache")),
+        "TIMEOUT": env.int("LIBRARY_CACHE_TIMEOUT", default=60 * 5),
+        "OPTIONS": {"MAX_ENTRIES": env.int("LIBRARY_CACHE_MAX_ENTRIES", default=5000)},
+    },
+}
+LIBRARY_CACHE_ALIAS = "library"
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -160,6 +177,18 @@ STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+BOOK_IMAGE_VARIANTS = {
+    "thumb": (160, 240),
+    "medium": (360, 540),
+}
+BOOK_IMAGE_WORKERS = env.int("BOOK_IMAGE_WORKERS", default=2)
+# Seconds a missing variant is served as the original before it is checked again.
+BOOK_IMAGE_MISSING_TTL = env.int("BOOK_IMAGE_MISSING_TTL", default=30)
+SEMANTIC_INDEX_DIR = env("SEMANTIC_INDEX_DIR", default=str(BASE_DIR / "semantic_index"))
+SEMANTIC_INDEX_DIM = env.int("SEMANTIC_INDEX_DIM", default=1024)
+# Books changed since the last build that are kept apart from the matrix
+# before being folded into an in-memory copy of it.
+SEMANTIC_INDEX_MAX_DELTA = env.int("SEMANTIC_INDEX_MAX_DELTA", default=2000)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -169,10 +198,52 @@ AUTH_USER_MODEL = "authentication.UserModel"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "authentication.authentication.CachedJWTAuthentication",
     ),
 }
 
+# How long a JWT-authenticated request may use the cached user record.
+AUTH_USER_CACHE_ALIAS = LIBRARY_CACHE_ALIAS
+AUTH_USER_CACHE_TIMEOUT = env.int("AUTH_USER_CACHE_TIMEOUT", default=60)
+
+BOOK_PAGE_SIZE = env.int("BOOK_PAGE_SIZE", default=20)
+BOOK_MAX_PAGE_SIZE = env.int("BOOK_MAX_PAGE_SIZE", default=100)
+
+SEARCH_HISTORY_WRITE_BEHIND = env.bool("SEARCH_HISTORY_WRITE_BEHIND", default=True)
+SEARCH_HISTORY_BUFFER_SIZE = env.int("SEARCH_HISTORY_BUFFER_SIZE", default=10000)
+SEARCH_HISTORY_BATCH_SIZE = env.int("SEARCH_HISTORY_BATCH_SIZE", default=200)
+SEARCH_HISTORY_FLUSH_INTERVAL = env.float("SEARCH_HISTORY_FLUSH_INTERVAL", default=2.0)
+SEARCH_HISTORY_MAX_PER_USER = env.int("SEARCH_HISTORY_MAX_PER_USER", default=100)
+SEARCH_HISTORY_RETENTION_MONTHS = env.int("SEARCH_HISTORY_RETENTION_MONTHS", default=12)
+SEARCH_HISTORY_PARTITIONS_AHEAD = env.int("SEARCH_HISTORY_PARTITIONS_AHEAD", default=3)
+
+SEARCH_STATS_HOURLY_DAYS = env.int("SEARCH_STATS_HOURLY_DAYS", default=2)
+SEARCH_STATS_RETENTION_DAYS = env.int("SEARCH_STATS_RETENTION_DAYS", default=90)
+POPULAR_SEARCHES_LIMIT = env.int("POPULAR_SEARCHES_LIMIT", default=10)
+POPULAR_SEARCHES_MAX_LIMIT = env.int("POPULAR_SEARCHES_MAX_LIMIT", default=50)
+POPULAR_SEARCHES_DAYS = env.int("POPULAR_SEARCHES_DAYS", default=7)
+POPULAR_SEARCHES_CACHE_TIMEOUT = env.int("POPULAR_SEARCHES_CACHE_TIMEOUT", default=60)
+
+# Token buckets for /search/: "<requests>/<s|min|hour|day>" refill rate plus
+# how many requests may arrive back to back.
+SEARCH_THROTTLE_USER_RATE = env("SEARCH_THROTTLE_USER_RATE", default="20/min")
+SEARCH_THROTTLE_USER_BURST = env.int("SEARCH_THROTTLE_USER_BURST", default=5)
+SEARCH_THROTTLE_GLOBAL_RATE = env("SEARCH_THROTTLE_GLOBAL_RATE", default="600/min")
+SEARCH_THROTTLE_GLOBAL_BURST = env.int("SEARCH_THROTTLE_GLOBAL_BURST", default=50)
+
+AUTOCOMPLETE_LIMIT = env.int("AUTOCOMPLETE_LIMIT", default=10)
+AUTOCOMPLETE_MAX_LIMIT = env.int("AUTOCOMPLETE_MAX_LIMIT", default=25)
+AUTOCOMPLETE_HISTORY_DAYS = env.int("AUTOCOMPLETE_HISTORY_DAYS", default=30)
+AUTOCOMPLETE_REFRESH_INTERVAL = env.float("AUTOCOMPLETE_REFRESH_INTERVAL", default=600.0)
+AUTOCOMPLETE_MIN_REBUILD_INTERVAL = env.float("AUTOCOMPLETE_MIN_REBUILD_INTERVAL", default=60.0)
+
+METRICS_ENABLED = env.bool("METRICS_ENABLED", default=True)
+METRICS_SAMPLE_RATE = env.float("METRICS_SAMPLE_RATE", default=1.0)
+# /metrics answers only requests carrying this bearer token, coming from these
+# addresses (REMOTE_ADDR, i.e. the proxy when behind one) or from staff users.
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+METRICS_ALLOWED_IPS = env.list("METRICS_ALLOWED_IPS", default=["127.0.0.1", "::1"])
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
@@ -201,6 +272,14 @@ SWAGGER_SETTINGS = {
 GOOGLE_CLIENT_ID = env('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = env('GOOGLE_CLIENT_SECRET')
 GEMINI_API_KEY = env('GEMINI_API_KEY')
+GEMINI_TIMEOUT = env.float("GEMINI_TIMEOUT", default=4.0)
+GEMINI_SLOW_CALL_THRESHOLD = env.float("GEMINI_SLOW_CALL_THRESHOLD", default=2.5)
+GEMINI_BREAKER_FAILURE_THRESHOLD = env.int("GEMINI_BREAKER_FAILURE_THRESHOLD", default=5)
+GEMINI_BREAKER_RESET_TIMEOUT = env.float("GEMINI_BREAKER_RESET_TIMEOUT", default=30.0)
+KEYWORD_CACHE_SIZE = env.int("KEYWORD_CACHE_SIZE", default=1024)
+KEYWORD_CACHE_MEMORY_TTL = env.int("KEYWORD_CACHE_MEMORY_TTL", default=60 * 10)
+KEYWORD_CACHE_DB_TTL = env.int("KEYWORD_CACHE_DB_TTL", default=60 * 60 * 24 * 7)
+KEYWORD_CACHE_DB_MAX_ENTRIES = env.int("KEYWORD_CACHE_DB_MAX_ENTRIES", default=50000)
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -22,6 +22,7 @@ from django.conf.urls.i18n import i18n_patterns, set_language
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from core.views import metrics_view
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -44,6 +45,7 @@ urlpatterns += [
     path("i18n/", include("django.conf.urls.i18n")),
     path("i18n/setlang/", set_language, name="set_language"),
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 if settings.DEBUG:
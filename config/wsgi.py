@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# Only server processes get here, not management commands: load the
+# autocomplete index now instead of on the first request.
+from library.autocomplete import autocomplete_index  # noqa: E402
+
+autocomplete_index.warm()
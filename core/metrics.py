@@ -0,0 +1,110 @@
+import bisect
+import contextvars
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Per-request accumulator; None when the current request is not sampled.
+request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, name, description, buckets, labelnames):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: ([*counts], total) for labels, (counts, total) in self._series.items()}
+        for labels, (counts, total) in sorted(series.items()):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels))
+            prefix = f"{label_text}," if label_text else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            suffix = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, name, description, buckets=LATENCY_BUCKETS, labelnames=()):
+        histogram = Histogram(name, description, buckets, labelnames)
+        self.histograms.append(histogram)
+        return histogram
+
+    def register_collector(self, collector):
+        # collector() returns extra exposition lines, e.g. gauges read from
+        # objects that keep their own counters.
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Wall time of HTTP requests.", labelnames=("view", "method", "status"),
+)
+request_sql_queries = registry.histogram(
+    "http_request_sql_queries", "SQL queries executed per HTTP request.", COUNT_BUCKETS, labelnames=("view",),
+)
+request_sql_duration = registry.histogram(
+    "http_request_sql_duration_seconds", "Time spent in SQL per HTTP request.", labelnames=("view",),
+)
+request_gemini_duration = registry.histogram(
+    "http_request_gemini_duration_seconds", "Time spent waiting for Gemini per HTTP request.",
+    labelnames=("view",),
+)
+
+
+def sql_execute_wrapper(execute, sql, params, many, context):
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats["sql_queries"] += 1
+        stats["sql_seconds"] += time.perf_counter() - started
+
+
+def add_request_time(key, seconds):
+    stats = request_stats.get()
+    if stats is not None:
+        stats[key] = stats.get(key, 0.0) + seconds
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
@@ -0,0 +1,87 @@
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import (
+    request_duration, request_gemini_duration, request_sql_duration, request_sql_queries, request_stats,
+    sql_execute_wrapper,
+)
+
+
+def install_sql_wrapper(sender, connection, **kwargs):
+    if sql_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_execute_wrapper)
+
+
+# Queries of async views run in sync_to_async threads with their own
+# connections, so the wrapper is attached to every connection as it is opened
+# and reads the per-request stats from the context variable.
+connection_created.connect(install_sql_wrapper, dispatch_uid="core.metrics.install_sql_wrapper")
+
+
+class MetricsMiddleware:
+    # Records wall time, SQL count/time and Gemini time per URL name into the
+    # histograms rendered on /metrics. With METRICS_SAMPLE_RATE below 1 only
+    # that fraction of requests is measured; the rest pass straight through.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.METRICS_SAMPLE_RATE
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        for connection in connections.all(initialized_only=True):
+            install_sql_wrapper(None, connection)
+        token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            stats = request_stats.get()
+            request_stats.reset(token)
+        self.record(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stats = request_stats.get()
+            request_stats.reset(token)
+        self.record(request, response, stats, started)
+        return response
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def start(self):
+        token = request_stats.set({"sql_queries": 0, "sql_seconds": 0.0, "gemini_seconds": 0.0})
+        return token, time.perf_counter()
+
+    def record(self, request, response, stats, started):
+        elapsed = time.perf_counter() - started
+        # Unresolved paths share one label so scanners cannot blow up the
+        # number of series.
+        match = request.resolver_match
+        view = match.view_name if match is not None else "unmatched"
+        request_duration.observe(elapsed, view, request.method, f"{response.status_code // 100}xx")
+        request_sql_queries.observe(stats["sql_queries"], view)
+        request_sql_duration.observe(stats["sql_seconds"], view)
+        if stats["gemini_seconds"]:
+            request_gemini_duration.observe(stats["gemini_seconds"], view)
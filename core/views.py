@@ -0,0 +1,30 @@
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse
+
+from .metrics import registry
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def metrics_allowed(request):
+    # Scrapers send METRICS_TOKEN as a bearer token or connect from one of
+    # METRICS_ALLOWED_IPS; staff can open the page from a browser session.
+    token = settings.METRICS_TOKEN
+    header = request.headers.get("Authorization", "")
+    if token and header.startswith("Bearer ") and hmac.compare_digest(header[len("Bearer "):], token):
+        return True
+    if request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS:
+        return True
+    user = getattr(request, "user", None)
+    return bool(user and user.is_staff)
+
+
+def metrics_view(request):
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
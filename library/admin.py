@@ -1,6 +1,6 @@
 from django.contrib import admin
 from modeltranslation.admin import TranslationAdmin
-from .models import GenreModel, BookModel, SearchHistory
+from .models import GenreModel, BookModel, SearchHistory, SearchQueryStat
 
 
 @admin.register(GenreModel)
@@ -16,3 +16,10 @@ class BookAdmin(admin.ModelAdmin):
     search_fields = ("title", "author", "description")
 
 admin.site.register(SearchHistory)
+
+
+@admin.register(SearchQueryStat)
+class SearchQueryStatAdmin(admin.ModelAdmin):
+    list_display = ("query", "language", "granularity", "bucket", "count")
+    list_filter = ("language", "granularity")
+    search_fields = ("query",)
@@ -1,6 +1,19 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
 
 
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library'
+
+    def ready(self):
+        from core.metrics import registry
+        from .metrics import library_metrics
+        from .signals import (
+            create_postgres_extensions, deduplicate_search_requests, guard_partitioned_search_history,
+        )
+
+        pre_migrate.connect(create_postgres_extensions, sender=self)
+        pre_migrate.connect(deduplicate_search_requests, sender=self)
+        pre_migrate.connect(guard_partitioned_search_history, sender=self)
+        registry.register_collector(library_metrics)
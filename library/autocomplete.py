@@ -0,0 +1,327 @@
+import bisect
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models.functions import Length
+
+from .models import BookModel, GenreModel
+from .response_cache import get_catalog_version
+from .search_stats import popular_searches
+
+logger = logging.getLogger(__name__)
+
+APOSTROPHES_RE = re.compile(r"[ʻʼ‘’`]")
+WORD_START_RE = re.compile(r"(?:^|\s)(?=\S)")
+# Results for very short prefixes cover a large part of the index, so they
+# are memoized until the next change.
+MEMO_PREFIX_LENGTH = 3
+HISTORY_QUERIES = 10000
+
+
+def normalize(text):
+    return " ".join(APOSTROPHES_RE.sub("'", text).split()).casefold()
+
+
+def suggestion_keys(text):
+    # The full text and every word suffix, so "river" also finds "Love river".
+    normalized = normalize(text)
+    return {normalized[match.end():] for match in WORD_START_RE.finditer(normalized)} if normalized else set()
+
+
+class PrefixIndex:
+    # Suggestions of one language in a sorted (key, entry_id) list searched
+    # with bisect. AutocompleteIndex serializes all access with its lock.
+
+    def __init__(self, popularity):
+        self.popularity = popularity
+        self.keys = []
+        self.entries = {}
+        self.scores = {}
+        self.refs = {}
+        self.memo = {}
+        self.building = True
+        self._ids = itertools.count()
+
+    def add(self, kind, text, object_id=None):
+        # Authors are shared between books, so entries are reference counted
+        # by (kind, text, object_id).
+        if not text or not text.strip():
+            return None
+        ref = (kind, text.strip(), object_id)
+        entry = self.refs.get(ref)
+        if entry is not None:
+            entry[1] += 1
+            return ref
+        entry_id = next(self._ids)
+        keys = suggestion_keys(ref[1])
+        self.refs[ref] = [entry_id, 1]
+        self.entries[entry_id] = (ref, keys)
+        if self.building:
+            # Sorted and scored once in finish().
+            self.keys.extend((key, entry_id) for key in keys)
+        else:
+            self.scores[entry_id] = self.score(keys)
+            for key in keys:
+                bisect.insort(self.keys, (key, entry_id))
+            self.memo = {}
+        return ref
+
+    def remove(self, ref):
+        entry = self.refs.get(ref)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] > 0:
+            return
+        entry_id = entry[0]
+        del self.refs[ref]
+        ref, keys = self.entries.pop(entry_id)
+        self.scores.pop(entry_id, None)
+        for key in keys:
+            position = bisect.bisect_left(self.keys, (key, entry_id))
+            if position < len(self.keys) and self.keys[position] == (key, entry_id):
+                del self.keys[position]
+        self.memo = {}
+
+    def finish(self, scan_limit):
+        # Scores every entry at once: each recent search adds its count to
+        # the suggestions whose keys it is a prefix of, i.e. the suggestions
+        # that would have completed it.
+        self.keys.sort()
+        self.building = False
+        self.scores = dict.fromkeys(self.entries, 0)
+        for query, count in self.popularity.counts.items():
+            for entry_id in self.matching(query, scan_limit):
+                self.scores[entry_id] += count
+
+    def score(self, keys):
+        # Same as finish() for a single entry added later.
+        queries = set()
+        for key in keys:
+            for length in self.popularity.lengths:
+                if length > len(key):
+                    break
+                if key[:length] in self.popularity.counts:
+                    queries.add(key[:length])
+        return sum(self.popularity.counts[query] for query in queries)
+
+    def matching(self, prefix, scan_limit):
+        keys = self.keys
+        found = set()
+        position = bisect.bisect_left(keys, (prefix,))
+        for key, entry_id in itertools.islice(keys, position, position + scan_limit):
+            if not key.startswith(prefix):
+                break
+            found.add(entry_id)
+        return found
+
+    def suggest(self, prefix, limit, scan_limit):
+        memo_key = (prefix, limit) if len(prefix) <= MEMO_PREFIX_LENGTH else None
+        if memo_key in self.memo:
+            return self.memo[memo_key]
+
+        entries, scores = self.entries, self.scores
+
+        def rank(entry_id):
+            kind, text, object_id = entries[entry_id][0]
+            return -scores.get(entry_id, 0), len(text), text
+
+        # Different books can share a title; over-fetch and keep the first
+        # of each (type, text) pair.
+        result = []
+        seen = set()
+        for entry_id in heapq.nsmallest(limit * 4, self.matching(prefix, scan_limit), key=rank):
+            kind, text, object_id = entries[entry_id][0]
+            if (kind, text) in seen:
+                continue
+            seen.add((kind, text))
+            result.append({"text": text, "type": kind, "id": object_id})
+            if len(result) == limit:
+                break
+        if memo_key is not None:
+            self.memo[memo_key] = result
+        return result
+
+
+class Popularity:
+    def __init__(self, counts):
+        self.counts = counts
+        self.lengths = sorted({len(query) for query in counts})
+
+    @classmethod
+    def load(cls, language, days):
+        counts = {}
+        for row in popular_searches(language, days, HISTORY_QUERIES):
+            query = normalize(row["query"])
+            if query:
+                counts[query] = counts.get(query, 0) + row["searches"]
+        return cls(counts)
+
+
+class AutocompleteIndex:
+    # Per-language prefix indexes over translated titles, authors and genre
+    # names, ranked by how often recent searches (from the popular-searches
+    # rollup) led to each suggestion.
+    #
+    # Built in a background thread at server start (warm()) or on first use;
+    # until it is ready, suggest() answers from a plain prefix query on the
+    # database. Then kept current in this process by the book and genre
+    # signals. Other processes rebuild in a background thread when the
+    # catalog version changes (at most every min_rebuild_interval seconds)
+    # and every refresh_interval seconds to pick up new search history; the
+    # old index keeps answering meanwhile.
+
+    def __init__(self, languages, refresh_interval, min_rebuild_interval, history_days, scan_limit=2000):
+        self.languages = tuple(languages)
+        self.scan_limit = scan_limit
+        self.refresh_interval = refresh_interval
+        self.min_rebuild_interval = min_rebuild_interval
+        self.history_days = history_days
+        self._indexes = None
+        self._books = {}
+        self._version = None
+        self._built = 0.0
+        self._checked = 0.0
+        self._lock = threading.RLock()
+        self._rebuilding = False
+
+    def suggest(self, prefix, language, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        indexes = self._current()
+        if indexes is None:
+            return self._suggest_from_db(prefix, language, limit)
+        with self._lock:
+            return indexes[language].suggest(prefix, limit, self.scan_limit)
+
+    def warm(self):
+        with self._lock:
+            if self._indexes is not None or self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, name="autocomplete-build", daemon=True).start()
+
+    def update_book(self, book):
+        with self._lock:
+            if self._indexes is None:
+                return
+            self._remove_book(book.pk)
+            self._add_book(book.pk, {f"{field}_{lang}": getattr(book, f"{field}_{lang}")
+                                     for field in ("title", "author") for lang in self.languages})
+
+    def remove_book(self, book_id):
+        with self._lock:
+            if self._indexes is not None:
+                self._remove_book(book_id)
+
+    def update_genre(self, genre):
+        with self._lock:
+            if self._indexes is None:
+                return
+            for lang, index in self._indexes.items():
+                for ref in [ref for ref in index.refs if ref[0] == "genre" and ref[2] == str(genre.pk)]:
+                    index.remove(ref)
+                index.add("genre", getattr(genre, f"name_{lang}"), str(genre.pk))
+
+    def remove_genre(self, genre_id):
+        with self._lock:
+            if self._indexes is None:
+                return
+            for index in self._indexes.values():
+                for ref in [ref for ref in index.refs if ref[0] == "genre" and ref[2] == str(genre_id)]:
+                    index.remove(ref)
+
+    def _current(self):
+        if self._indexes is None:
+            self.warm()
+            return self._indexes
+
+        now = time.monotonic()
+        if now - self._checked >= 1:
+            self._checked = now
+            stale = now - self._built >= self.refresh_interval or (
+                now - self._built >= self.min_rebuild_interval and get_catalog_version() != self._version
+            )
+            if stale and not self._rebuilding:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild_in_background, name="autocomplete-rebuild", daemon=True).start()
+        return self._indexes
+
+    def _rebuild_in_background(self):
+        try:
+            self._build()
+        except Exception:
+            logger.exception("Failed to rebuild the autocomplete index")
+        finally:
+            self._rebuilding = False
+            close_old_connections()
+
+    def _suggest_from_db(self, prefix, language, limit):
+        # Only matches the start of each text, not of every word, and is not
+        # ranked by search history: good enough while the index is loading.
+        sources = [
+            ("title", BookModel, f"title_{language}", True),
+            ("author", BookModel, f"author_{language}", False),
+            ("genre", GenreModel, f"name_{language}", True),
+        ]
+        result = []
+        seen = set()
+        for kind, model, field, has_id in sources:
+            rows = (
+                model.objects.filter(**{f"{field}__istartswith": prefix})
+                .order_by(Length(field), field)
+                .values_list(field, "id")[:limit * 4]
+            )
+            for text, object_id in rows:
+                if (kind, text) in seen:
+                    continue
+                seen.add((kind, text))
+                result.append({"text": text, "type": kind, "id": str(object_id) if has_id else None})
+                if len(result) == limit:
+                    return result
+        return result
+
+    def _build(self):
+        version = get_catalog_version()
+        indexes = {lang: PrefixIndex(Popularity.load(lang, self.history_days)) for lang in self.languages}
+        books = {}
+        fields = [f"{field}_{lang}" for field in ("title", "author") for lang in self.languages]
+        for row in BookModel.objects.order_by().values("id", *fields).iterator(chunk_size=2000):
+            books[row["id"]] = self._index_book(indexes, row["id"], row)
+        for row in GenreModel.objects.values("id", *[f"name_{lang}" for lang in self.languages]):
+            for lang, index in indexes.items():
+                index.add("genre", row[f"name_{lang}"], str(row["id"]))
+        for index in indexes.values():
+            index.finish(self.scan_limit)
+        with self._lock:
+            self._indexes, self._books, self._version = indexes, books, version
+            self._built = time.monotonic()
+
+    def _index_book(self, indexes, book_id, row):
+        refs = []
+        for lang, index in indexes.items():
+            refs.append((lang, index.add("title", row[f"title_{lang}"], str(book_id))))
+            refs.append((lang, index.add("author", row[f"author_{lang}"])))
+        return [(lang, ref) for lang, ref in refs if ref is not None]
+
+    def _add_book(self, book_id, row):
+        self._books[book_id] = self._index_book(self._indexes, book_id, row)
+
+    def _remove_book(self, book_id):
+        for lang, ref in self._books.pop(book_id, ()):
+            self._indexes[lang].remove(ref)
+
+
+autocomplete_index = AutocompleteIndex(
+    languages=settings.MODELTRANSLATION_LANGUAGES,
+    refresh_interval=settings.AUTOCOMPLETE_REFRESH_INTERVAL,
+    min_rebuild_interval=settings.AUTOCOMPLETE_MIN_REBUILD_INTERVAL,
+    history_days=settings.AUTOCOMPLETE_HISTORY_DAYS,
+)
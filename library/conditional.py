@@ -0,0 +1,51 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .genres import genre_index
+
+
+def make_validators(fingerprint, *parts):
+    # The fingerprint covers the filters, language and origin of the request;
+    # the parts pin the validators to the rows actually served.
+    last_modified = max((part for part in parts if hasattr(part, "timestamp")), default=None)
+    digest = hashlib.sha256(":".join([fingerprint, *map(str, parts)]).encode()).hexdigest()
+    return {
+        "etag": quote_etag(digest[:32]),
+        "last_modified": int(last_modified.timestamp()) if last_modified else None,
+    }
+
+
+def list_validators(queryset, fingerprint):
+    # Drop the ordering and the selected columns: Postgres only needs the ids
+    # and updated_at of the matching rows, not a sort or a row per column.
+    stats = queryset.order_by().values("id").aggregate(count=Count("id"), book_updated_at=Max("updated_at"))
+    validators = make_validators(fingerprint, stats["count"], stats["book_updated_at"], genre_index.last_modified())
+    # Deleting a book changes the count, and so the ETag, but no remaining
+    # updated_at moves: a Last-Modified date would let If-Modified-Since
+    # answer 304 for a list that lost rows. Lists are validated by ETag only.
+    validators["last_modified"] = None
+    return validators
+
+
+def detail_validators(queryset, fingerprint):
+    updated_at = queryset.values_list("updated_at", flat=True).first()
+    if updated_at is None:
+        return None
+    return make_validators(fingerprint, updated_at, genre_index.last_modified())
+
+
+def not_modified_response(request, validators):
+    return get_conditional_response(
+        request._request, etag=validators["etag"], last_modified=validators["last_modified"],
+    )
+
+
+def set_validators(response, validators):
+    response["ETag"] = validators["etag"]
+    if validators["last_modified"] is not None:
+        response["Last-Modified"] = http_date(validators["last_modified"])
+    patch_vary_headers(response, ["Accept-Language"])
+    return response
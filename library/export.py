@@ -0,0 +1,74 @@
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import BookModel
+
+TRANSLATED_FIELDS = ("title", "author", "description")
+PLAIN_FIELDS = ("year", "language", "image", "youtube_url", "library_url", "store_url")
+
+
+def export_fields(languages):
+    return [
+        "id", "created_at", "updated_at", "genre_id",
+        *[f"{field}_{lang}" for field in TRANSLATED_FIELDS for lang in languages],
+        *[f"genre__name_{lang}" for lang in languages],
+        *PLAIN_FIELDS,
+    ]
+
+
+def export_record(row, languages):
+    # Flat keys in the same layout import_books reads, so an export can be
+    # loaded straight back into another instance.
+    record = {
+        "id": row["id"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+        "genre_id": row["genre_id"],
+    }
+    for field in TRANSLATED_FIELDS:
+        for lang in languages:
+            record[f"{field}_{lang}"] = row[f"{field}_{lang}"]
+    for lang in languages:
+        record[f"genre_{lang}"] = row[f"genre__name_{lang}"]
+    for field in PLAIN_FIELDS:
+        record[field] = row[field]
+    return record
+
+
+def export_rows(languages):
+    return BookModel.objects.order_by().values(*export_fields(languages))
+
+
+def export_line(row, languages):
+    return json.dumps(export_record(row, languages), cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def iter_ndjson(chunk_size=2000):
+    # .iterator() streams through a server-side cursor, so only one chunk of
+    # rows is in memory at a time; lines are yielded a chunk at a time too.
+    languages = list(settings.MODELTRANSLATION_LANGUAGES)
+    lines = []
+    for row in export_rows(languages).iterator(chunk_size=chunk_size):
+        lines.append(export_line(row, languages))
+        if len(lines) >= chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+async def aiter_ndjson(chunk_size=2000):
+    # Same stream for ASGI, where Django would read a sync iterator into a
+    # list before sending the first byte. .aiterator() fetches each chunk
+    # from the same server-side cursor in a worker thread.
+    languages = list(settings.MODELTRANSLATION_LANGUAGES)
+    lines = []
+    async for row in export_rows(languages).aiterator(chunk_size=chunk_size):
+        lines.append(export_line(row, languages))
+        if len(lines) >= chunk_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
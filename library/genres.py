@@ -0,0 +1,108 @@
+import threading
+
+from django.conf import settings
+
+from .models import GenreModel
+from .response_cache import get_catalog_version
+
+MATCH_MEMO_SIZE = 1024
+# get_catalog_version() is None under DummyCache or when the cache is down,
+# so None cannot mean "not loaded".
+UNLOADED = object()
+
+
+def normalize_name(text):
+    return text.casefold()
+
+
+def genre_representation(genre, lang):
+    if genre is None:
+        return None
+    return {"id": genre["id"], "name": genre[f"name_{lang}"] or genre["name"]}
+
+
+class GenreIndex:
+    # Process-local copy of the (tiny) genre table. It answers the genre
+    # filter as a list of ids, so the books query becomes genre_id IN (...)
+    # instead of a join with icontains over every translated name, and it
+    # serves the translated names to serializers.
+    #
+    # The copy is rebuilt when the catalog version changes, which covers
+    # edits made by other processes; genre signals in this process drop it
+    # right away.
+
+    def __init__(self, languages):
+        self.name_fields = tuple(f"name_{lang}" for lang in languages)
+        self._lock = threading.Lock()
+        self._version = UNLOADED
+        self._genres = {}
+        self._names = ()
+        self._matches = {}
+        self._last_modified = None
+
+    def invalidate(self):
+        self._version = UNLOADED
+
+    def snapshot(self):
+        # Checks the catalog version once; callers rendering many rows keep
+        # the returned dict instead of calling get() per row.
+        self._ensure_loaded()
+        return self._genres
+
+    def get(self, genre_id):
+        genre = self.snapshot().get(genre_id)
+        if genre is None:
+            # Possibly created after the last load: reload once before giving up.
+            self.invalidate()
+            genre = self.snapshot().get(genre_id)
+        return genre
+
+    def last_modified(self):
+        # Newest updated_at over all genres, for the book validators.
+        self._ensure_loaded()
+        return self._last_modified
+
+    def ids_matching(self, text, language=None):
+        # Same rows as OR-ing name_<lang>__icontains over the translations,
+        # or name_<language>__icontains alone when a language is given.
+        self._ensure_loaded()
+        term = normalize_name(text)
+        matches = self._matches
+        ids = matches.get((term, language))
+        if ids is None:
+            ids = sorted({
+                genre_id for field, name, genre_id in self._names
+                if term in name and (language is None or field == f"name_{language}")
+            })
+            if len(matches) >= MATCH_MEMO_SIZE:
+                matches.clear()
+            matches[(term, language)] = ids
+        return ids
+
+    def _ensure_loaded(self):
+        version = get_catalog_version()
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version == version:
+                return
+            genres = {}
+            names = []
+            last_modified = None
+            for row in GenreModel.objects.values("id", "name", "updated_at", *self.name_fields):
+                genres[row["id"]] = {
+                    "id": str(row["id"]),
+                    "name": row["name"],
+                    **{field: row[field] for field in self.name_fields},
+                }
+                names.extend((field, normalize_name(row[field]), row["id"]) for field in self.name_fields if row[field])
+                if last_modified is None or row["updated_at"] > last_modified:
+                    last_modified = row["updated_at"]
+            # Swapped in together so readers see either the old or the new
+            # copy, never a mix.
+            self._genres, self._names, self._matches = genres, tuple(names), {}
+            self._last_modified = last_modified
+            self._version = version
+
+
+genre_index = GenreIndex(settings.MODELTRANSLATION_LANGUAGES)
@@ -0,0 +1,119 @@
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import SearchHistory
+from .retention import prune_users
+from .search_stats import record_searches
+
+logger = logging.getLogger(__name__)
+
+
+class SearchHistoryBuffer:
+    # Collects search history rows in memory and writes them with bulk_create
+    # from a background thread, once batch_size rows are queued or every
+    # flush_interval seconds. The queue is bounded: when it is full the oldest
+    # rows are dropped so a stalled database cannot exhaust worker memory.
+    # Each written batch is also added to the popular-searches rollup, and the
+    # users in it are trimmed to their newest max_per_user rows.
+
+    def __init__(self, max_size: int, batch_size: int, flush_interval: float, enabled: bool = True,
+                 max_per_user: int = 0):
+        self.batch_size = batch_size
+        self.max_per_user = max_per_user
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self.dropped = 0
+        self._queue = deque(maxlen=max_size)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def add(self, user_id, query: str, language: str = None) -> None:
+        if not self.enabled:
+            self.write([(user_id, query, language, timezone.now())])
+            return
+
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append((user_id, query, language, timezone.now()))
+            batch_ready = len(self._queue) >= self.batch_size
+        self._ensure_worker()
+        if batch_ready:
+            self._wakeup.set()
+
+    async def aadd(self, user_id, query: str, language: str = None) -> None:
+        if not self.enabled:
+            await sync_to_async(self.write)([(user_id, query, language, timezone.now())])
+            return
+        self.add(user_id, query, language)
+
+    def flush(self) -> int:
+        with self._lock:
+            batch = list(self._queue)
+            self._queue.clear()
+        if not batch:
+            return 0
+
+        try:
+            self.write(batch)
+        except Exception:
+            self.dropped += len(batch)
+            logger.exception("Failed to write %s search history rows", len(batch))
+            return 0
+        return len(batch)
+
+    def write(self, batch) -> None:
+        with transaction.atomic():
+            SearchHistory.objects.bulk_create(
+                [
+                    SearchHistory(user_id=user_id, query=query, created_at=searched_at)
+                    for user_id, query, language, searched_at in batch
+                ],
+                batch_size=self.batch_size,
+            )
+            record_searches(
+                (query, language, searched_at) for user_id, query, language, searched_at in batch
+            )
+        if self.max_per_user:
+            prune_users([user_id for user_id, query, language, searched_at in batch], self.max_per_user)
+
+    def _ensure_worker(self) -> None:
+        # Started lazily and per process, so pre-forking servers get one
+        # flusher per worker instead of a dead thread inherited from the master.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="search-history-flusher", daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+search_history_buffer = SearchHistoryBuffer(
+    max_size=settings.SEARCH_HISTORY_BUFFER_SIZE,
+    batch_size=settings.SEARCH_HISTORY_BATCH_SIZE,
+    flush_interval=settings.SEARCH_HISTORY_FLUSH_INTERVAL,
+    enabled=settings.SEARCH_HISTORY_WRITE_BEHIND,
+    max_per_user=settings.SEARCH_HISTORY_MAX_PER_USER,
+)
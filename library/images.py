@@ -0,0 +1,127 @@
+import logging
+import multiprocessing
+import os
+import posixpath
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Derivatives are written next to the original, e.g. book/image/cover.png ->
+# book/image/variants/cover_thumb.webp and book/image/variants/cover_thumb.jpg.
+IMAGE_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_existing_variants = set()
+_missing_variants = {}
+
+
+def variant_name(name, variant, extension):
+    directory, filename = posixpath.split(posixpath.splitext(name)[0])
+    return posixpath.join(directory, "variants", f"{filename}_{variant}.{extension}")
+
+
+def variant_names(name, variants):
+    return {
+        variant: {extension: variant_name(name, variant, extension) for extension in IMAGE_FORMATS}
+        for variant in variants
+    }
+
+
+def variant_exists(storage, name, missing_ttl=0):
+    # Rendered variants are only ever replaced, never removed, so a positive
+    # answer is remembered and a steady-state listing costs no file checks.
+    # A negative answer is remembered for missing_ttl seconds, or until the
+    # render task in this process finishes (forget_missing_variants).
+    if name in _existing_variants:
+        return True
+    if _missing_variants.get(name, 0) > time.monotonic():
+        return False
+    if storage.exists(name):
+        _existing_variants.add(name)
+        _missing_variants.pop(name, None)
+        return True
+    if missing_ttl:
+        _missing_variants[name] = time.monotonic() + missing_ttl
+    return False
+
+
+def forget_missing_variants(name, variants):
+    for paths in variant_names(name, variants).values():
+        for path in paths.values():
+            _missing_variants.pop(path, None)
+
+
+def variant_jobs(name, storage, variants, force=False):
+    targets = []
+    for variant, size in variants.items():
+        for extension, (image_format, options) in IMAGE_FORMATS.items():
+            target = variant_name(name, variant, extension)
+            if force or not storage.exists(target):
+                targets.append((tuple(size), storage.path(target), image_format, options))
+    if not targets:
+        return None
+    return storage.path(name), targets
+
+
+def render_variants(job):
+    # Runs in a worker process: plain Pillow and file paths only, no ORM.
+    # Pillow is imported here so web processes that never render do not
+    # load it.
+    from PIL import Image, ImageOps
+
+    source_path, targets = job
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        for size, target_path, image_format, options in targets:
+            variant = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            temporary_path = f"{target_path}.tmp"
+            variant.save(temporary_path, image_format, **options)
+            os.replace(temporary_path, target_path)
+    return len(targets)
+
+
+def get_executor(max_workers):
+    # Spawned rather than forked: the web process is multi-threaded, and the
+    # workers only need this module and Pillow.
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"),
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def schedule_variants(name, storage, variants, max_workers):
+    job = variant_jobs(name, storage, variants)
+    if job is None:
+        return None
+    future = get_executor(max_workers).submit(render_variants, job)
+    future.add_done_callback(lambda done: _finish(name, variants, done))
+    return future
+
+
+def _finish(name, variants, future):
+    forget_missing_variants(name, variants)
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error("Failed to render image variants for %s: %r", name, error)
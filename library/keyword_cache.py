@@ -0,0 +1,116 @@
+import threading
+from datetime import timedelta
+from typing import List, Optional
+
+from asgiref.sync import sync_to_async
+from cachetools import TTLCache
+from django.conf import settings
+from django.utils import timezone
+
+from .models import SearchRequestModel
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class KeywordCache:
+    # The memory tier is a per-process LRU with a short TTL; the database tier
+    # (search_request table) is shared by all workers and survives restarts.
+    EVICTION_INTERVAL = 100
+
+    def __init__(self, maxsize: int, memory_ttl: int, db_ttl: int, db_max_entries: int):
+        self._memory = TTLCache(maxsize=maxsize, ttl=memory_ttl)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.db_ttl = db_ttl
+        self.db_max_entries = db_max_entries
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "memory_size": len(self._memory),
+        }
+
+    def get(self, query: str, language: str) -> Optional[List[str]]:
+        key = (normalize_query(query), language)
+        keywords = self._get_memory(key)
+        if keywords is not None:
+            return keywords
+        return self._get_db(key)
+
+    async def aget(self, query: str, language: str) -> Optional[List[str]]:
+        key = (normalize_query(query), language)
+        keywords = self._get_memory(key)
+        if keywords is not None:
+            return keywords
+        return await sync_to_async(self._get_db)(key)
+
+    def set(self, query: str, language: str, keywords: List[str]) -> None:
+        key = (normalize_query(query), language)
+        with self._lock:
+            self._memory[key] = list(keywords)
+            self._writes += 1
+            evict = self._writes % self.EVICTION_INTERVAL == 0
+        SearchRequestModel.objects.update_or_create(
+            query=key[0], language=key[1], defaults={"keywords": list(keywords)},
+        )
+        if evict:
+            self.evict()
+
+    async def aset(self, query: str, language: str, keywords: List[str]) -> None:
+        await sync_to_async(self.set)(query, language, keywords)
+
+    def evict(self) -> int:
+        expired_before = timezone.now() - timedelta(seconds=self.db_ttl)
+        deleted, _ = SearchRequestModel.objects.filter(updated_at__lt=expired_before).delete()
+        oldest_kept = (
+            SearchRequestModel.objects.order_by("-updated_at")
+            .values_list("updated_at", flat=True)[self.db_max_entries:self.db_max_entries + 1]
+            .first()
+        )
+        if oldest_kept is not None:
+            overflow, _ = SearchRequestModel.objects.filter(updated_at__lte=oldest_kept).delete()
+            deleted += overflow
+        return deleted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+
+    def _get_memory(self, key) -> Optional[List[str]]:
+        with self._lock:
+            keywords = self._memory.get(key)
+            if keywords is not None:
+                self.memory_hits += 1
+                return list(keywords)
+        return None
+
+    def _get_db(self, key) -> Optional[List[str]]:
+        fresh_after = timezone.now() - timedelta(seconds=self.db_ttl)
+        keywords = (
+            SearchRequestModel.objects.filter(query=key[0], language=key[1], updated_at__gte=fresh_after)
+            .values_list("keywords", flat=True)
+            .first()
+        )
+        with self._lock:
+            if not keywords:
+                self.misses += 1
+                return None
+            self.db_hits += 1
+            self._memory[key] = list(keywords)
+        return list(keywords)
+
+
+keyword_cache = KeywordCache(
+    maxsize=settings.KEYWORD_CACHE_SIZE,
+    memory_ttl=settings.KEYWORD_CACHE_MEMORY_TTL,
+    db_ttl=settings.KEYWORD_CACHE_DB_TTL,
+    db_max_entries=settings.KEYWORD_CACHE_DB_MAX_ENTRIES,
+)
@@ -0,0 +1,68 @@
+import re
+from typing import List
+
+TOKEN_RE = re.compile(r"[\w'ʻʼ‘’-]+", re.UNICODE)
+
+STOP_WORDS = {
+    "uz": {
+        "men", "sen", "u", "biz", "siz", "ular", "menga", "bizga", "va", "bilan", "uchun", "haqida", "bir",
+        "bu", "shu", "ham", "yoki", "lekin", "ammo", "edi", "emas", "kerak", "bor", "yo'q", "qanday",
+        "qaysi", "nima", "kitob", "kitoblar", "kitobni", "izlayman", "izlayapman", "qidiryapman",
+        "qidiraman", "istayman", "xohlayman", "o'qimoqchiman", "topib", "bering", "ber", "iltimos",
+    },
+    "ru": {
+        "я", "ты", "он", "она", "мы", "вы", "они", "мне", "нам", "и", "в", "во", "на", "с", "со", "о", "об",
+        "про", "для", "по", "не", "что", "как", "это", "или", "а", "но", "из", "к", "у", "от", "до", "за",
+        "какую", "какой", "какие", "книга", "книгу", "книги", "книг", "хочу", "ищу", "найти", "найди",
+        "нужна", "нужно", "нужен", "почитать", "прочитать", "пожалуйста", "есть", "бы", "что-нибудь",
+    },
+    "en": {
+        "i", "am", "me", "my", "we", "you", "a", "an", "the", "and", "or", "of", "for", "to", "in", "on", "about",
+        "with", "by", "is", "are", "was", "be", "that", "this", "it", "some", "something", "any", "want",
+        "looking", "look", "find", "search", "searching", "need", "book", "books", "read", "please", "like",
+        "would", "recommend", "give", "show",
+    },
+}
+
+# Longest suffixes first; a suffix is only stripped when a stem of at least
+# MIN_STEM_LENGTH characters remains.
+SUFFIXES = {
+    "uz": (
+        "laridagi", "lardagi", "laridan", "larning", "lardan", "larini", "larida", "larga", "larni",
+        "larda", "ning", "dagi", "lari", "lar", "dan", "lik", "chi", "siz", "ni", "ga", "da", "li",
+    ),
+    "ru": (
+        "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ией", "ий", "ый", "ой", "ей", "ая",
+        "яя", "ое", "ее", "ые", "ие", "ов", "ев", "ам", "ям", "ах", "ях", "ом", "ем", "ию", "ия", "а", "я",
+        "ы", "и", "у", "ю", "е", "о", "ь",
+    ),
+    "en": (
+        "ational", "fulness", "ization", "ations", "ation", "ness", "ment", "ing", "ies", "ied", "ers",
+        "er", "ed", "es", "ly", "s",
+    ),
+}
+
+MIN_STEM_LENGTH = 3
+
+
+def stem(word: str, language: str) -> str:
+    for suffix in SUFFIXES.get(language, ()):
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            return word[: -len(suffix)]
+    return word
+
+
+def extract_keywords(query: str, language: str = "uz") -> List[str]:
+    stop_words = STOP_WORDS.get(language, set())
+    keywords = []
+    for token in TOKEN_RE.findall(query.lower()):
+        token = token.strip("'ʻʼ‘’-")
+        if len(token) < 2 or token.isdigit():
+            continue
+        token_stem = stem(token, language)
+        if token in stop_words or token_stem in stop_words:
+            continue
+        for keyword in (token, token_stem):
+            if keyword not in keywords:
+                keywords.append(keyword)
+    return keywords or [query.strip()]
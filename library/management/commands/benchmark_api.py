@@ -0,0 +1,195 @@
+import itertools
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+from unittest import mock
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import translation
+
+from authentication.models import UserModel
+from authentication.utils import create_jwt_token
+from library.history import search_history_buffer
+from library.keywords import extract_keywords
+from library.seed import AUTHORS, GENRES, WORDS, seed_catalog
+
+LIST_FILTERS = ("author", "genre", "year", "language", "search")
+
+
+def stub_ai_search_books(query, language="uz"):
+    return extract_keywords(query, language), "stub"
+
+
+async def stub_ai_search_books_async(query, language="uz"):
+    return stub_ai_search_books(query, language)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank percentile.
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and measure latency, throughput and SQL query counts of the "
+        "library API. Results are written as JSON so runs can be compared between commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--genres", type=int, default=20)
+        parser.add_argument("--books", type=int, default=5000)
+        parser.add_argument("--requests", type=int, default=50, help="Requests per scenario.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmark.json")
+        parser.add_argument("--response-cache", action="store_true",
+                            help="Keep the response cache enabled (by default every request is a cache miss).")
+        parser.add_argument("--only", nargs="*", default=None,
+                            help="Run only scenarios whose name starts with one of these prefixes.")
+        parser.add_argument("--keepdb", action="store_true", help="Keep the test database between runs.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        library_cache = (
+            "django.core.cache.backends.locmem.LocMemCache" if options["response_cache"]
+            else "django.core.cache.backends.dummy.DummyCache"
+        )
+        caches = {**settings.CACHES, settings.LIBRARY_CACHE_ALIAS: {"BACKEND": library_cache}}
+        try:
+            # History is written synchronously so its cost is measured and no
+            # buffered rows outlive the test database.
+            with override_settings(CACHES=caches), \
+                    mock.patch.object(search_history_buffer, "enabled", False), \
+                    mock.patch("library.views.ai_search_books", stub_ai_search_books), \
+                    mock.patch("library.views._ai_search_books_async", stub_ai_search_books_async), \
+                    translation.override(settings.LANGUAGE_CODE):
+                results = self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+            teardown_test_environment()
+
+        with open(options["output"], "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run_benchmark(self, options):
+        rng = random.Random(options["seed"])
+        started = time.monotonic()
+        genre_ids, book_ids = seed_catalog(genres=options["genres"], books=options["books"], seed=options["seed"])
+        self.stdout.write(f"Seeded {len(genre_ids)} genres and {len(book_ids)} books "
+                          f"in {time.monotonic() - started:.1f}s")
+
+        user = UserModel.objects.create_user(email="benchmark@example.com")
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {create_jwt_token(user)['access']}"}
+        client = Client(raise_request_exception=False)
+
+        scenarios = list(self.scenarios(rng, book_ids, auth))
+        if options["only"]:
+            scenarios = [s for s in scenarios if s[0].startswith(tuple(options["only"]))]
+
+        report = {}
+        for name, make_request in scenarios:
+            report[name] = self.measure(client, make_request, options["requests"])
+            row = report[name]
+            self.stdout.write(
+                f"{name:<48} p50={row['p50_ms']:.1f}ms p95={row['p95_ms']:.1f}ms p99={row['p99_ms']:.1f}ms "
+                f"rps={row['rps']:.0f} queries={row['queries_avg']:.1f}"
+            )
+
+        return {
+            "meta": {
+                "commit": self.git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "genres": options["genres"],
+                "books": options["books"],
+                "requests": options["requests"],
+                "seed": options["seed"],
+                "response_cache": options["response_cache"],
+            },
+            "scenarios": report,
+        }
+
+    def scenarios(self, rng, book_ids, auth):
+        book_list = reverse("book-list")
+        filter_values = {
+            "author": lambda: rng.choice(AUTHORS[rng.choice(list(AUTHORS))]).split()[0],
+            "genre": lambda: rng.choice(GENRES[rng.choice(list(GENRES))]),
+            "year": lambda: str(rng.randint(1900, 2025)),
+            "language": lambda: rng.choice(["uz", "ru", "en"]),
+            "search": lambda: rng.choice(WORDS["en"]),
+        }
+
+        yield "book-list", lambda client: client.get(book_list)
+        yield "book-list?page_size=20", lambda client: client.get(book_list, {"page_size": 20})
+        for size in range(1, len(LIST_FILTERS) + 1):
+            for combination in itertools.combinations(LIST_FILTERS, size):
+                yield (
+                    "book-list?" + "&".join(combination),
+                    lambda client, combination=combination: client.get(
+                        book_list, {name: filter_values[name]() for name in combination}
+                    ),
+                )
+        yield "book-list?author&fuzzy", lambda client: client.get(
+            book_list, {"author": filter_values["author"](), "fuzzy": 1}
+        )
+
+        yield "book-detail", lambda client: client.get(reverse("book-detail", args=[rng.choice(book_ids)]))
+
+        def search(client, url):
+            language = rng.choice(["uz", "ru", "en"])
+            query = " ".join(rng.sample(WORDS[language], 2))
+            return client.post(url, {"query": query, "language": language}, content_type="application/json", **auth)
+
+        yield "book-search", lambda client: search(client, reverse("book-search"))
+        yield "book-search-async", lambda client: search(client, reverse("book-search-async"))
+        yield "search-history", lambda client: client.get(reverse("search-history"), **auth)
+
+    def measure(self, client, make_request, requests):
+        latencies = []
+        queries = []
+        errors = 0
+        started = time.perf_counter()
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as context:
+                request_started = time.perf_counter()
+                response = make_request(client)
+                latencies.append((time.perf_counter() - request_started) * 1000)
+            queries.append(len(context.captured_queries))
+            if response.status_code >= 400:
+                errors += 1
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            "requests": requests,
+            "errors": errors,
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "max_ms": latencies[-1],
+            "rps": requests / elapsed if elapsed else 0.0,
+            "queries_avg": sum(queries) / len(queries),
+            "queries_max": max(queries),
+        }
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
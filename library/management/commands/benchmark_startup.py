@@ -0,0 +1,91 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Modules whose import dominates start-up; the report says which of them
+# a plain `import config.wsgi` loaded.
+HEAVY_MODULES = ("google.generativeai", "grpc", "google.protobuf", "numpy", "PIL")
+
+PROBE = (
+    "import json, sys, config.wsgi; "
+    f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold start-up time: `manage.py check` and `import config.wsgi`, each in a fresh "
+        "interpreter. Results are written as JSON so runs can be compared between commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per scenario.")
+        parser.add_argument("--output", default="benchmark_startup.json")
+
+    def handle(self, *args, **options):
+        scenarios = {
+            "manage_check": [sys.executable, os.path.join(settings.BASE_DIR, "manage.py"), "check"],
+            "import_wsgi": [sys.executable, "-c", "import config.wsgi"],
+        }
+        report = {}
+        for name, command in scenarios.items():
+            report[name] = self.measure(command, options["runs"])
+            row = report[name]
+            self.stdout.write(
+                f"{name:<16} min={row['min_ms']:.0f}ms median={row['median_ms']:.0f}ms max={row['max_ms']:.0f}ms"
+            )
+
+        loaded = json.loads(self.run([sys.executable, "-c", PROBE]).stdout)
+        self.stdout.write(f"Loaded by import config.wsgi: {', '.join(loaded) or 'none of ' + ', '.join(HEAVY_MODULES)}")
+
+        results = {
+            "meta": {
+                "commit": self.git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "runs": options["runs"],
+            },
+            "scenarios": report,
+            "wsgi_heavy_modules": loaded,
+        }
+        with open(options["output"], "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def measure(self, command, runs):
+        # The first run warms the OS page cache and the .pyc files, so every
+        # measured run starts a cold interpreter on warm disks.
+        self.run(command)
+        durations = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            self.run(command)
+            durations.append((time.perf_counter() - started) * 1000)
+        return {
+            "runs": runs,
+            "min_ms": min(durations),
+            "median_ms": statistics.median(durations),
+            "max_ms": max(durations),
+        }
+
+    def run(self, command):
+        return subprocess.run(
+            command, cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,26 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library.response_cache import bump_catalog_version
+from library.semantic import build_index
+
+
+class Command(BaseCommand):
+    help = "Build the on-disk semantic search matrices (one per language) used by the semantic search mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--languages", nargs="*", default=list(settings.MODELTRANSLATION_LANGUAGES))
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        for language in options["languages"]:
+            started = time.monotonic()
+            count = build_index(
+                settings.SEMANTIC_INDEX_DIR, language, settings.SEMANTIC_INDEX_DIM, chunk_size=options["chunk_size"],
+            )
+            self.stdout.write(f"{language}: {count} books in {time.monotonic() - started:.1f}s")
+        # Running processes check for a new matrix when the catalog version moves.
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Semantic index written to {settings.SEMANTIC_INDEX_DIR}"))
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library.search_stats import compact_search_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold hourly popular-search buckets older than --hourly-days into daily buckets and delete buckets "
+        "older than --retention-days. Meant to run daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hourly-days", type=int, default=settings.SEARCH_STATS_HOURLY_DAYS)
+        parser.add_argument("--retention-days", type=int, default=settings.SEARCH_STATS_RETENTION_DAYS)
+
+    def handle(self, *args, **options):
+        compacted, expired = compact_search_stats(options["hourly_days"], options["retention_days"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {compacted} daily buckets and deleted {expired} expired buckets."
+        ))
@@ -0,0 +1,30 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.export import iter_ndjson
+
+
+class Command(BaseCommand):
+    help = "Stream the whole book catalog as NDJSON (one book per line)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default="-", help="Output file path, or - for stdout.")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched per cursor round-trip.")
+
+    def handle(self, *args, **options):
+        output = options["output"]
+        stream = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+        started = time.monotonic()
+        books = 0
+        try:
+            for chunk in iter_ndjson(chunk_size=options["chunk_size"]):
+                stream.write(chunk)
+                books += chunk.count("\n")
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(f"Exported {books} books in {elapsed:.1f}s.")
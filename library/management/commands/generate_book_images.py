@@ -0,0 +1,47 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library.images import render_variants, variant_jobs
+from library.models import BookModel
+from library.response_cache import bump_catalog_version
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail/WebP variants for existing book cover images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(),
+                            help="Number of worker processes.")
+        parser.add_argument("--force", action="store_true", help="Re-render variants that already exist.")
+
+    def handle(self, *args, **options):
+        storage = BookModel._meta.get_field("image").storage
+        names = (
+            BookModel.objects.exclude(image="").order_by().values_list("image", flat=True).distinct().iterator()
+        )
+        jobs = (variant_jobs(name, storage, settings.BOOK_IMAGE_VARIANTS, force=options["force"]) for name in names)
+
+        started = time.monotonic()
+        images = files = failed = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            pending = [executor.submit(render_variants, job) for job in jobs if job is not None]
+            for future in pending:
+                try:
+                    files += future.result()
+                    images += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"Failed to render variants: {e!r}")
+
+        if files:
+            # Cached responses point missing variants at the original image.
+            bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {files} files for {images} images in {elapsed:.1f}s ({failed} failed)."
+        ))
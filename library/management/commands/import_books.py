@@ -0,0 +1,154 @@
+import csv
+import json
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from library.models import LANGUAGE_CHOICES, BookModel, GenreModel
+from library.response_cache import bump_catalog_version
+
+TRANSLATED_FIELDS = ("title", "author", "description")
+OPTIONAL_FIELDS = ("image", "youtube_url", "library_url", "store_url")
+LANGUAGE_CODES = {code for code, _ in LANGUAGE_CHOICES}
+
+
+class GenreResolver:
+    # Every translated genre name maps to its id, so the import never queries
+    # the genre table per row; unknown genres are created once and remembered.
+
+    def __init__(self, languages):
+        self.languages = languages
+        self.ids = {}
+        self.created = 0
+        for genre in GenreModel.objects.values("id", *[f"name_{lang}" for lang in languages]):
+            self._remember(genre["id"], [genre[f"name_{lang}"] for lang in languages])
+
+    def resolve(self, row):
+        names = {lang: (row.get(f"genre_{lang}") or "").strip() for lang in self.languages}
+        if not any(names.values()):
+            names[settings.MODELTRANSLATION_DEFAULT_LANGUAGE] = (row.get("genre") or "").strip()
+        if not any(names.values()):
+            raise ValueError("genre is required")
+
+        for name in names.values():
+            genre_id = self.ids.get(name.casefold()) if name else None
+            if genre_id:
+                return genre_id
+
+        genre = GenreModel.objects.create(**{f"name_{lang}": name for lang, name in names.items() if name})
+        self.created += 1
+        self._remember(genre.id, names.values())
+        return genre.id
+
+    def _remember(self, genre_id, names):
+        for name in names:
+            if name:
+                self.ids.setdefault(name.casefold(), genre_id)
+
+
+class Command(BaseCommand):
+    help = "Stream books from a CSV or JSONL file into the catalog using batched inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path to a .csv or .jsonl file, or - to read from stdin.")
+        parser.add_argument("--format", choices=["csv", "jsonl"],
+                            help="Input format; guessed from the file extension when omitted.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT batch.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        input_format = options["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        batch_size = options["batch_size"]
+        languages = list(settings.MODELTRANSLATION_LANGUAGES)
+
+        try:
+            stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8-sig")
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+        genres = GenreResolver(languages)
+        imported = skipped = 0
+        started = time.monotonic()
+        batch = []
+        with stream:
+            rows = csv.DictReader(stream) if input_format == "csv" else self.read_jsonl(stream)
+            for line, row in enumerate(rows, start=1):
+                try:
+                    if input_format == "jsonl":
+                        row = self.parse_jsonl(row)
+                    batch.append(self.build_book(row, genres, languages))
+                except (KeyError, TypeError, ValueError) as e:
+                    skipped += 1
+                    self.stderr.write(f"Skipping record {line}: {e}")
+                    continue
+
+                if len(batch) >= batch_size:
+                    imported += self.flush(batch)
+                    self.report(imported, started)
+
+            imported += self.flush(batch)
+
+        if imported or genres.created:
+            bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} books ({skipped} skipped, {genres.created} new genres) in {elapsed:.1f}s "
+            f"({imported / elapsed if elapsed else 0:.0f} rows/s)."
+        ))
+        if imported:
+            self.stdout.write("Run 'manage.py generate_book_images' to render cover variants for new images.")
+
+    def read_jsonl(self, stream):
+        # Lines are parsed by parse_jsonl() inside the per-record error
+        # handling, so one malformed line is skipped like any invalid row.
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield line
+
+    def parse_jsonl(self, line):
+        row = json.loads(line)
+        if not isinstance(row, dict):
+            raise ValueError(f"expected a JSON object, got {type(row).__name__}")
+        return row
+
+    def build_book(self, row, genres, languages):
+        values = {}
+        for field in TRANSLATED_FIELDS:
+            for lang in languages:
+                value = (row.get(f"{field}_{lang}") or "").strip()
+                if value:
+                    values[f"{field}_{lang}"] = value
+            if not any(key.startswith(f"{field}_") for key in values):
+                raise ValueError(f"at least one {field}_<lang> column is required")
+
+        language = (row.get("language") or "en").strip()
+        if language not in LANGUAGE_CODES:
+            raise ValueError(f"unknown language {language!r}")
+
+        for field in OPTIONAL_FIELDS:
+            value = (row.get(field) or "").strip()
+            if value:
+                values[field] = value
+
+        return BookModel(
+            genre_id=genres.resolve(row),
+            year=int(row["year"]),
+            language=language,
+            **values,
+        )
+
+    def flush(self, batch):
+        if not batch:
+            return 0
+        BookModel.objects.bulk_create(batch)
+        count = len(batch)
+        batch.clear()
+        return count
+
+    def report(self, imported, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"  {imported} rows ({imported / elapsed if elapsed else 0:.0f} rows/s)")
@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from library import retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain monthly range partitions of search_history on created_at: create upcoming partitions and "
+        "drop the ones older than the retention. --convert turns the plain table created by migrate into a "
+        "partitioned one (run once, during a quiet period: it locks the table while copying). "
+        "Meant to run daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--convert", action="store_true", help="Convert the plain table to a partitioned one.")
+        parser.add_argument("--months-ahead", type=int, default=settings.SEARCH_HISTORY_PARTITIONS_AHEAD)
+        parser.add_argument("--retention-months", type=int, default=settings.SEARCH_HISTORY_RETENTION_MONTHS)
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Partitioning requires PostgreSQL.")
+
+        partitioned = retention.is_partitioned()
+        if options["convert"]:
+            if partitioned:
+                raise CommandError("search_history is already partitioned.")
+            retention.convert_to_partitioned(options["months_ahead"])
+            partitioned = True
+            self.stdout.write("Converted search_history to monthly partitions.")
+
+        if not partitioned:
+            deleted = retention.delete_older_than(options["retention_months"])
+            self.stdout.write(self.style.WARNING(
+                f"search_history is not partitioned; deleted {deleted} expired rows instead. "
+                f"Run with --convert to switch to partitions."
+            ))
+            return
+
+        created = retention.ensure_partitions(options["months_ahead"])
+        dropped = retention.drop_partitions(options["retention_months"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created partitions: {', '.join(created) or 'none'}; dropped: {', '.join(dropped) or 'none'}."
+        ))
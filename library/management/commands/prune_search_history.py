@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library.retention import prune_all_users
+
+
+class Command(BaseCommand):
+    help = "Keep only the newest --keep search history rows of every user, deleting the rest in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep", type=int, default=settings.SEARCH_HISTORY_MAX_PER_USER)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted, users = prune_all_users(options["keep"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} rows of {users} users."))
@@ -0,0 +1,25 @@
+from .history import search_history_buffer
+from .keyword_cache import keyword_cache
+from .utils import gemini_breaker
+
+
+def library_metrics():
+    stats = keyword_cache.stats
+    lines = [
+        "# HELP library_keyword_cache_lookups_total Keyword cache lookups by outcome.",
+        "# TYPE library_keyword_cache_lookups_total counter",
+    ]
+    for outcome in ("memory_hits", "db_hits", "misses"):
+        lines.append(f'library_keyword_cache_lookups_total{{outcome="{outcome}"}} {stats[outcome]}')
+    lines += [
+        "# HELP library_keyword_cache_memory_entries Entries in the in-process keyword cache.",
+        "# TYPE library_keyword_cache_memory_entries gauge",
+        f"library_keyword_cache_memory_entries {stats['memory_size']}",
+        "# HELP library_gemini_breaker_open Whether the Gemini circuit breaker is rejecting calls.",
+        "# TYPE library_gemini_breaker_open gauge",
+        f"library_gemini_breaker_open {int(gemini_breaker.state != gemini_breaker.CLOSED)}",
+        "# HELP library_search_history_dropped_total Search history rows dropped by the write-behind buffer.",
+        "# TYPE library_search_history_dropped_total counter",
+        f"library_search_history_dropped_total {search_history_buffer.dropped}",
+    ]
+    return lines
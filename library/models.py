@@ -1,4 +1,8 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models.functions import Upper
+from django.utils import timezone
 
 from authentication.models import UserModel
 from core.base import BaseModel
@@ -9,6 +13,29 @@ LANGUAGE_CHOICES = (
     ("uz", "Uzbek"),
 )
 
+# Postgres ships no Uzbek dictionary, so Uzbek text is indexed with the
+# language-agnostic "simple" configuration (lower-casing, no stemming).
+SEARCH_CONFIGS = {
+    "uz": "simple",
+    "ru": "russian",
+    "en": "english",
+}
+
+
+def book_search_vector(language):
+    config = SEARCH_CONFIGS[language]
+    return (
+            SearchVector(f"title_{language}", weight="A", config=config)
+            + SearchVector(f"author_{language}", weight="B", config=config)
+            + SearchVector(f"description_{language}", weight="D", config=config)
+    )
+
+
+def trigram_index(field, name):
+    # icontains compiles to UPPER(column) LIKE UPPER(...), so the index is
+    # built over the same expression for the planner to pick it up.
+    return GinIndex(OpClass(Upper(field), name="gin_trgm_ops"), name=name)
+
 
 class GenreModel(BaseModel):
     name = models.CharField(max_length=255)
@@ -20,6 +47,18 @@ class GenreModel(BaseModel):
         db_table = "genre"
         verbose_name_plural = "Genres"
         verbose_name = "Genre"
+        indexes = [
+            trigram_index("name_uz", "genre_name_uz_trgm"),
+            trigram_index("name_ru", "genre_name_ru_trgm"),
+            trigram_index("name_en", "genre_name_en_trgm"),
+        ]
+
+
+class BookManager(models.Manager):
+    def get_queryset(self):
+        # The generated tsvector columns are only used inside WHERE clauses;
+        # loading them would ship every document's lexemes with each row.
+        return super().get_queryset().defer("search_uz", "search_ru", "search_en")
 
 
 class BookModel(BaseModel):
@@ -33,6 +72,17 @@ class BookModel(BaseModel):
     youtube_url = models.URLField(blank=True, null=True)
     library_url = models.URLField(blank=True, null=True)
     store_url = models.URLField(blank=True, null=True)
+    search_uz = models.GeneratedField(
+        expression=book_search_vector("uz"), output_field=SearchVectorField(), db_persist=True,
+    )
+    search_ru = models.GeneratedField(
+        expression=book_search_vector("ru"), output_field=SearchVectorField(), db_persist=True,
+    )
+    search_en = models.GeneratedField(
+        expression=book_search_vector("en"), output_field=SearchVectorField(), db_persist=True,
+    )
+
+    objects = BookManager()
 
     def __str__(self):
         return f"{self.title} ({self.author})"
@@ -41,16 +91,40 @@ class BookModel(BaseModel):
         db_table = "book"
         verbose_name_plural = "Books"
         verbose_name = "Book"
+        indexes = [
+            models.Index(fields=["-created_at", "-id"], name="book_created_at_id_idx"),
+            models.Index(fields=["language", "year"], name="book_language_year_idx"),
+            models.Index(fields=["year"], name="book_year_idx"),
+            GinIndex(fields=["search_uz"], name="book_search_uz_gin"),
+            GinIndex(fields=["search_ru"], name="book_search_ru_gin"),
+            GinIndex(fields=["search_en"], name="book_search_en_gin"),
+            trigram_index("author_uz", "book_author_uz_trgm"),
+            trigram_index("author_ru", "book_author_ru_trgm"),
+            trigram_index("author_en", "book_author_en_trgm"),
+            trigram_index("title_uz", "book_title_uz_trgm"),
+            trigram_index("title_ru", "book_title_ru_trgm"),
+            trigram_index("title_en", "book_title_en_trgm"),
+        ]
 
 
 class SearchHistory(BaseModel):
     user = models.ForeignKey(UserModel, on_delete=models.CASCADE, related_name="search_histories", )
     query = models.CharField(max_length=255)
+    # Not auto_now_add: rows are written in batches after the fact and keep
+    # the time of the search itself.
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         db_table = "search_history"
         verbose_name = "Search history"
         verbose_name_plural = "Search histories"
+        indexes = [
+            # Covers the "last 20 searches of a user" query, including the
+            # serialized columns, so it can be answered by an index-only scan.
+            models.Index(
+                fields=["user", "-created_at"], include=["id", "query"], name="search_history_user_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user} – {self.query[:10]})"
@@ -59,16 +133,55 @@ class SearchHistory(BaseModel):
 class SearchRequestModel(BaseModel):
     query = models.CharField(max_length=255)
     language = models.CharField(max_length=15, choices=LANGUAGE_CHOICES, default="uz")
+    keywords = models.JSONField(default=list, blank=True)
 
     class Meta:
         db_table = "search_request"
         verbose_name = "Search request"
         verbose_name_plural = "Search requests"
+        constraints = [
+            models.UniqueConstraint(fields=["query", "language"], name="search_request_query_language_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["updated_at"], name="search_request_updated_at_idx"),
+        ]
 
     def __str__(self):
         return f"{self.query} ({self.language})"
 
 
+class SearchQueryStat(BaseModel):
+    HOUR = "hour"
+    DAY = "day"
+    GRANULARITY_CHOICES = (
+        (HOUR, "Hour"),
+        (DAY, "Day"),
+    )
+
+    query = models.CharField(max_length=255)
+    language = models.CharField(max_length=15, choices=LANGUAGE_CHOICES)
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES, default=HOUR)
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "search_query_stat"
+        verbose_name = "Search query stat"
+        verbose_name_plural = "Search query stats"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["query", "language", "granularity", "bucket"], name="search_query_stat_bucket_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["language", "bucket"], name="search_query_stat_lang_idx"),
+            models.Index(fields=["granularity", "bucket"], name="search_query_stat_gran_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.query} ({self.language}, {self.bucket:%Y-%m-%d %H:00}): {self.count}"
+
+
 class FilterRequestModel(BaseModel):
     author = models.CharField(max_length=255, null=True, blank=True)
     genre = models.CharField(max_length=255, null=True, blank=True, )
@@ -0,0 +1,58 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class BookCursorPagination(CursorPagination):
+    ordering = ("-created_at", "-id")
+    page_size = getattr(settings, "BOOK_PAGE_SIZE", 20)
+    page_size_query_param = "page_size"
+    max_page_size = getattr(settings, "BOOK_MAX_PAGE_SIZE", 100)
+    cursor_query_param = "cursor"
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+
+class BookRankedPagination(LimitOffsetPagination):
+    # For lists ordered by similarity: a cursor can only page through a fixed
+    # column ordering, so these pages are addressed by offset. The response
+    # has the same shape as BookCursorPagination and no COUNT query is run;
+    # one extra row tells whether there is a next page.
+    default_limit = getattr(settings, "BOOK_PAGE_SIZE", 20)
+    limit_query_param = "page_size"
+    max_limit = getattr(settings, "BOOK_MAX_PAGE_SIZE", 100)
+    offset_query_param = "offset"
+
+    def is_requested(self, request):
+        params = request.query_params
+        return any(param in params for param in ("cursor", self.limit_query_param, self.offset_query_param))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        self.offset = self.get_offset(request)
+        rows = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        return rows[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), "cursor")
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_previous_link(self):
+        if self.offset <= 0:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), "cursor")
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        if self.offset - self.limit <= 0:
+            return remove_query_param(url, self.offset_query_param)
+        return replace_query_param(url, self.offset_query_param, self.offset - self.limit)
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "previous": self.get_previous_link(), "results": data})
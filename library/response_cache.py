@@ -0,0 +1,49 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+
+CATALOG_VERSION_KEY = "library:catalog-version"
+
+
+def get_response_cache():
+    return caches[settings.LIBRARY_CACHE_ALIAS]
+
+
+def get_catalog_version():
+    cache = get_response_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seeded from the clock so a wiped counter never reuses old keys.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache = get_response_cache()
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def request_fingerprint(request, lang, **kwargs):
+    params = sorted(
+        (key, value.strip())
+        for key, values in request.query_params.lists()
+        if key != "lang"
+        for value in values
+        if value.strip()
+    )
+    params.extend(sorted(kwargs.items()))
+    params.append(("_lang", lang))
+    # Absolute image and pagination URLs depend on the scheme and host.
+    params.append(("_origin", request.build_absolute_uri("/")))
+    return hashlib.sha256(urlencode(params).encode()).hexdigest()
+
+
+def response_cache_key(request, view_name, lang, **kwargs):
+    return f"library:{view_name}:{get_catalog_version()}:{request_fingerprint(request, lang, **kwargs)}"
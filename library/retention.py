@@ -0,0 +1,248 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, migrations, models, transaction
+from django.utils import timezone
+
+from .models import SearchHistory
+
+TABLE = SearchHistory._meta.db_table
+
+# Rows beyond the newest `keep` of each user, found with a window over the
+# (user_id, created_at DESC) index and deleted at most `limit` at a time.
+# The id/created_at pair identifies a row in both the plain and the
+# partitioned table (where the primary key has to include created_at).
+PRUNE_SQL = f"""
+    DELETE FROM {TABLE} AS history
+    USING (
+        SELECT id, created_at FROM (
+            SELECT id, created_at,
+                   row_number() OVER (PARTITION BY user_id ORDER BY created_at DESC, id DESC) AS position
+            FROM {TABLE}
+            WHERE user_id = ANY(%s)
+        ) AS ranked
+        WHERE position > %s
+        LIMIT %s
+    ) AS stale
+    WHERE history.id = stale.id AND history.created_at = stale.created_at
+"""
+
+OVER_LIMIT_SQL = f"SELECT user_id FROM {TABLE} GROUP BY user_id HAVING COUNT(*) > %s"
+
+
+def prune_users(user_ids, keep, batch_size=1000):
+    user_ids = list({user_id for user_id in user_ids if user_id is not None})
+    if not user_ids or not keep:
+        return 0
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(PRUNE_SQL, [user_ids, keep, batch_size])
+            count = cursor.rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def prune_all_users(keep, batch_size=1000, users_per_batch=100):
+    with connection.cursor() as cursor:
+        cursor.execute(OVER_LIMIT_SQL, [keep])
+        user_ids = [row[0] for row in cursor.fetchall()]
+    deleted = 0
+    for start in range(0, len(user_ids), users_per_batch):
+        deleted += prune_users(user_ids[start:start + users_per_batch], keep, batch_size)
+    return deleted, len(user_ids)
+
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(moment, months):
+    month = moment.month - 1 + months
+    return moment.replace(year=moment.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(start):
+    return f"{TABLE}_y{start.year}m{start.month:02d}"
+
+
+def is_partitioned(using=DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relkind = 'p' FROM pg_class c WHERE c.oid = to_regclass(%s)", [TABLE],
+        )
+        row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def partitions():
+    # (name, lower bound) of the monthly partitions, oldest first.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s AND child.relname LIKE %s
+            ORDER BY child.relname
+            """,
+            [TABLE, f"{TABLE}_y%"],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return [(name, datetime(int(name[-7:-3]), int(name[-2:]), 1, tzinfo=dt_timezone.utc)) for name in names]
+
+
+def ensure_partitions(months_ahead, since=None):
+    # Creates the monthly partitions from `since` (default: this month)
+    # through `months_ahead` months from now. Meant to run from cron well
+    # before the month starts, so new rows never land in the default
+    # partition.
+    start = month_start(since or timezone.now())
+    end = add_months(month_start(timezone.now()), months_ahead)
+    existing = {name for name, lower in partitions()}
+    created = []
+    while start <= end:
+        name = partition_name(start)
+        if name not in existing:
+            create_partition(name, start, add_months(start, 1))
+            created.append(name)
+        start = add_months(start, 1)
+    return created
+
+
+def create_partition(name, start, end):
+    # Postgres refuses a new partition while the default partition holds rows
+    # in its range (e.g. when cron missed a month), so those rows are moved
+    # out first and inserted again once the partition exists.
+    default = f"{TABLE}_default"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {default} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"CREATE TEMPORARY TABLE {name}_moved (LIKE {TABLE}) ON COMMIT DROP")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {default} WHERE created_at >= %s AND created_at < %s RETURNING *
+            )
+            INSERT INTO {name}_moved SELECT * FROM moved
+            """,
+            [start, end],
+        )
+        moved = cursor.rowcount
+        cursor.execute(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)", [start, end])
+        if moved:
+            cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {name}_moved")
+    return moved
+
+
+def drop_partitions(keep_months):
+    # Dropping a whole month is a catalog operation; the equivalent DELETE
+    # would rewrite every index page and leave the table bloated.
+    cutoff = add_months(month_start(timezone.now()), -keep_months)
+    dropped = []
+    with connection.cursor() as cursor:
+        for name, lower in partitions():
+            if add_months(lower, 1) <= cutoff:
+                cursor.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+                cursor.execute(f"DROP TABLE {name}")
+                dropped.append(name)
+    return dropped
+
+
+def delete_older_than(keep_months, batch_size=5000):
+    # Fallback for a table that has not been converted yet.
+    cutoff = add_months(month_start(timezone.now()), -keep_months)
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {TABLE} WHERE id IN (SELECT id FROM {TABLE} WHERE created_at < %s LIMIT %s)",
+                [cutoff, batch_size],
+            )
+            count = cursor.rowcount
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def convert_to_partitioned(months_ahead):
+    # One-off conversion of the table created by migrate: the rows are copied
+    # into a table partitioned by month on created_at under the same name,
+    # with the same columns, foreign key and indexes. Unique constraints of a
+    # partitioned table must contain the partition key, so the primary key
+    # becomes (id, created_at); ids are still random UUIDs.
+    legacy = f"{TABLE}_legacy"
+    user_table = SearchHistory._meta.get_field("user").related_model._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE")
+        # A table with pending foreign key checks (rows written earlier in an
+        # enclosing transaction) cannot be dropped.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"SELECT MIN(created_at) FROM {TABLE}")
+        oldest = cursor.fetchone()[0]
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {legacy}")
+        cursor.execute(f"""
+            CREATE TABLE {TABLE} (
+                LIKE {legacy} INCLUDING DEFAULTS,
+                PRIMARY KEY (id, created_at),
+                FOREIGN KEY (user_id) REFERENCES {user_table} (id) DEFERRABLE INITIALLY DEFERRED
+            ) PARTITION BY RANGE (created_at)
+        """)
+        cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+        ensure_partitions(months_ahead, since=oldest)
+
+        # Index names are unique per schema, so the legacy ones are dropped
+        # together with the legacy table before being recreated. The
+        # (user_id, created_at) index also serves the foreign key, so the
+        # separate user_id index is not recreated.
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {legacy}")
+        cursor.execute(f"DROP TABLE {legacy}")
+        # Runs the deferred foreign key checks now; indexes cannot be built
+        # while they are pending.
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        with connection.schema_editor(atomic=False) as editor:
+            for index in SearchHistory._meta.indexes:
+                editor.add_index(SearchHistory, index)
+
+
+def keeps_partition_key(field):
+    return (
+        type(field) is models.DateTimeField and not field.null and not field.unique and not field.primary_key
+        and field.db_column is None and field.db_default is models.NOT_PROVIDED
+    )
+
+
+def unsupported_operations(plan):
+    # Migrations are generated from the model, which still describes the
+    # plain table (primary key on id alone). These operations cannot be
+    # applied to the partitioned table, where the primary key is
+    # (id, created_at) and every unique constraint must include created_at.
+    model_name = SearchHistory._meta.model_name
+    app_label = SearchHistory._meta.app_label
+    for migration, backwards in plan:
+        if migration.app_label != app_label:
+            continue
+        for operation in migration.operations:
+            # Field and constraint operations name the model in model_name,
+            # model option operations in name.
+            target = getattr(operation, "model_name_lower", None) or getattr(operation, "name_lower", None)
+            if target != model_name:
+                continue
+            if isinstance(operation, migrations.AlterField) and operation.name == "created_at":
+                # Only Python-side options such as the default may change.
+                unsupported = not keeps_partition_key(operation.field)
+            elif isinstance(operation, (migrations.AlterField, migrations.RemoveField, migrations.RenameField)):
+                names = {operation.name, getattr(operation, "new_name", operation.name)}
+                unsupported = bool(names & {"id", "created_at"})
+            elif isinstance(operation, migrations.AddField):
+                unsupported = operation.field.unique or operation.field.primary_key
+            elif isinstance(operation, migrations.AddConstraint):
+                constraint = operation.constraint
+                unsupported = (
+                    isinstance(constraint, models.UniqueConstraint) and "created_at" not in constraint.fields
+                )
+            else:
+                unsupported = isinstance(operation, migrations.AlterUniqueTogether)
+            if unsupported:
+                yield migration, operation
+
@@ -0,0 +1,82 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Greatest, Upper
+
+from .genres import genre_index
+from .models import SEARCH_CONFIGS
+
+# ts_rank weights for the D, C, B, A labels of the search vectors: title (A),
+# author (B), description (D). A genre match scores between author and
+# description, and hits on the user's own words count RAW_QUERY_WEIGHT times
+# more than hits on AI keywords.
+RANK_WEIGHTS = [0.1, 0.2, 0.4, 1.0]
+GENRE_WEIGHT = 0.2
+RAW_QUERY_WEIGHT = 2.0
+
+
+def build_search_query(terms, language):
+    config = SEARCH_CONFIGS[language]
+    search_query = None
+    for term in terms:
+        term_query = SearchQuery(term, search_type="websearch", config=config)
+        search_query = term_query if search_query is None else search_query | term_query
+    return search_query
+
+
+def search_books(queryset, text, languages=None):
+    languages = languages or list(SEARCH_CONFIGS)
+    search_filter = Q()
+    for language in languages:
+        search_filter |= Q(**{f"search_{language}": build_search_query([text], language)})
+    return queryset.filter(search_filter)
+
+
+def keyword_books(queryset, keywords, language, query=None):
+    # Ordered by relevance, so slicing the result asks Postgres for a top-N
+    # sort instead of returning whichever matches it reads first.
+    #
+    # Genre matches are resolved from the genre index into a literal id list:
+    # the tsvector match OR genre_id IN (...) is then a BitmapOr over the GIN
+    # index and the genre_id index, and only the candidates get ranked. A
+    # subquery on the genre table in the OR would make Postgres read every
+    # book instead.
+    if not keywords:
+        return queryset.none()
+
+    genre_ids = sorted({genre_id for keyword in keywords for genre_id in genre_index.ids_matching(keyword, language)})
+    vector = F(f"search_{language}")
+    search_query = build_search_query(keywords, language)
+    match = Q(**{f"search_{language}": search_query})
+    relevance = SearchRank(vector, search_query, weights=RANK_WEIGHTS)
+    if genre_ids:
+        match |= Q(genre_id__in=genre_ids)
+        relevance += Case(
+            When(genre_id__in=genre_ids, then=Value(GENRE_WEIGHT)), default=Value(0.0), output_field=FloatField(),
+        )
+    if query and query.strip():
+        raw_query = build_search_query([query], language)
+        relevance += Value(RAW_QUERY_WEIGHT) * SearchRank(vector, raw_query, weights=RANK_WEIGHTS)
+
+    return (
+        queryset.filter(match)
+        .annotate(relevance=relevance)
+        .order_by("-relevance", "-created_at", "-id")
+    )
+
+
+def fuzzy_filter(queryset, text, fields, score_name):
+    aliases = {f"{score_name}_{index}": Upper(field) for index, field in enumerate(fields)}
+    match = Q()
+    for alias in aliases:
+        match |= Q(**{f"{alias}__trigram_word_similar": text})
+    score = Greatest(*[TrigramWordSimilarity(text, alias) for alias in aliases])
+    return queryset.alias(**aliases).filter(match).annotate(**{score_name: score})
+
+
+def semantic_books(queryset, query, language, limit=50):
+    from .semantic import semantic_index
+
+    ranked = semantic_index.search(query, language, limit)
+    books = queryset.in_bulk([book_id for book_id, score in ranked])
+    # Deleted books can still be in the matrix until the next rebuild.
+    return [books[book_id] for book_id, score in ranked if book_id in books]
@@ -0,0 +1,95 @@
+import uuid
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import connection
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .keyword_cache import normalize_query
+from .models import SearchQueryStat
+
+UPSERT_BATCH_SIZE = 500
+
+# Counts are added to an existing bucket instead of overwriting it, which
+# bulk_create(update_conflicts=True) cannot express.
+UPSERT_SQL = """
+    INSERT INTO search_query_stat (id, created_at, updated_at, query, language, granularity, bucket, count)
+    VALUES {values}
+    ON CONFLICT (query, language, granularity, bucket)
+    DO UPDATE SET count = search_query_stat.count + EXCLUDED.count, updated_at = EXCLUDED.updated_at
+"""
+
+# Moves hourly rows older than the cutoff into daily rows in one statement,
+# so a concurrent reader never sees a search counted twice or not at all.
+COMPACT_SQL = """
+    WITH moved AS (
+        DELETE FROM search_query_stat
+        WHERE granularity = %(hour)s AND bucket < %(cutoff)s
+        RETURNING query, language, bucket, count
+    )
+    INSERT INTO search_query_stat (id, created_at, updated_at, query, language, granularity, bucket, count)
+    SELECT gen_random_uuid(), NOW(), NOW(), query, language, %(day)s, date_trunc('day', bucket, 'UTC'), SUM(count)
+    FROM moved
+    GROUP BY query, language, date_trunc('day', bucket, 'UTC')
+    ON CONFLICT (query, language, granularity, bucket)
+    DO UPDATE SET count = search_query_stat.count + EXCLUDED.count, updated_at = EXCLUDED.updated_at
+"""
+
+
+def hour_bucket(moment):
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment):
+    return hour_bucket(moment).replace(hour=0)
+
+
+def record_searches(searches):
+    # searches: iterable of (query, language, searched_at). Called by the
+    # history buffer with every batch it writes, so the rollup grows with the
+    # number of distinct queries per hour rather than with the history.
+    counts = Counter()
+    for query, language, searched_at in searches:
+        query = normalize_query(query)[:255]
+        if query and language:
+            counts[(query, language, hour_bucket(searched_at))] += 1
+    if not counts:
+        return 0
+
+    now = timezone.now()
+    rows = list(counts.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            params = []
+            for (query, language, bucket), count in batch:
+                params.extend([uuid.uuid4(), now, now, query, language, SearchQueryStat.HOUR, bucket, count])
+            values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+            cursor.execute(UPSERT_SQL.format(values=values), params)
+    return len(rows)
+
+
+def compact_search_stats(hourly_days, retention_days, now=None):
+    now = now or timezone.now()
+    # Whole days only, so a day is never split between the two granularities.
+    cutoff = day_bucket(now - timedelta(days=hourly_days))
+    with connection.cursor() as cursor:
+        cursor.execute(COMPACT_SQL, {"hour": SearchQueryStat.HOUR, "day": SearchQueryStat.DAY, "cutoff": cutoff})
+        compacted = cursor.rowcount
+    expired, _ = SearchQueryStat.objects.filter(bucket__lt=day_bucket(now - timedelta(days=retention_days))).delete()
+    return compacted, expired
+
+
+def popular_searches(language, days, limit):
+    since = timezone.now() - timedelta(days=days)
+    return list(
+        SearchQueryStat.objects.filter(language=language)
+        .filter(
+            Q(granularity=SearchQueryStat.HOUR, bucket__gte=hour_bucket(since))
+            | Q(granularity=SearchQueryStat.DAY, bucket__gte=day_bucket(since))
+        )
+        .values("query")
+        .annotate(searches=Sum("count"))
+        .order_by("-searches", "query")[:limit]
+    )
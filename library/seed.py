@@ -0,0 +1,83 @@
+import random
+import uuid
+
+from .models import LANGUAGE_CHOICES, BookModel, GenreModel
+
+# Small parallel vocabularies: index i means the same thing in every
+# language, so generated translations stay consistent with each other.
+WORDS = {
+    "uz": ["urush", "tinchlik", "sevgi", "yulduz", "tog'", "daryo", "shahar", "bog'", "tun", "kun", "yo'l",
+           "qalb", "sir", "orzu", "vatan", "do'st", "dengiz", "osmon", "bahor", "kuz", "qor", "olov", "suv",
+           "tarix", "sayohat", "ilm", "hikoya", "ertak", "qahramon", "bola"],
+    "ru": ["война", "мир", "любовь", "звезда", "гора", "река", "город", "сад", "ночь", "день", "дорога",
+           "сердце", "тайна", "мечта", "родина", "друг", "море", "небо", "весна", "осень", "снег", "огонь",
+           "вода", "история", "путешествие", "наука", "рассказ", "сказка", "герой", "ребёнок"],
+    "en": ["war", "peace", "love", "star", "mountain", "river", "city", "garden", "night", "day", "road",
+           "heart", "secret", "dream", "homeland", "friend", "sea", "sky", "spring", "autumn", "snow", "fire",
+           "water", "history", "journey", "science", "story", "tale", "hero", "child"],
+}
+GENRES = {
+    "uz": ["Roman", "Fantastika", "Detektiv", "She'riyat", "Tarix", "Ilmiy", "Bolalar", "Drama", "Sarguzasht",
+           "Biografiya"],
+    "ru": ["Роман", "Фантастика", "Детектив", "Поэзия", "История", "Наука", "Детская", "Драма", "Приключения",
+           "Биография"],
+    "en": ["Novel", "Fantasy", "Detective", "Poetry", "History", "Science", "Children", "Drama", "Adventure",
+           "Biography"],
+}
+AUTHORS = {
+    "uz": ["Abdulla Qodiriy", "Cho'lpon", "O'tkir Hoshimov", "Said Ahmad", "Erkin Vohidov", "Tohir Malik",
+           "Pirimqul Qodirov", "Abdulla Oripov"],
+    "ru": ["Абдулла Кадыри", "Чулпан", "Уткир Хашимов", "Саид Ахмад", "Эркин Вахидов", "Тахир Малик",
+           "Пиримкул Кадыров", "Абдулла Арипов"],
+    "en": ["Abdulla Qodiriy", "Cholpon", "Utkir Hoshimov", "Said Ahmad", "Erkin Vohidov", "Tohir Malik",
+           "Pirimqul Qodirov", "Abdulla Oripov"],
+}
+LANGUAGES = ("uz", "ru", "en")
+
+
+def seed_catalog(genres=20, books=2000, seed=0, batch_size=1000):
+    rng = random.Random(seed)
+    book_languages = [code for code, _ in LANGUAGE_CHOICES]
+
+    genre_objects = []
+    for index in range(genres):
+        base, suffix = GENRES["en"][index % len(GENRES["en"])], index // len(GENRES["en"])
+        genre_objects.append(GenreModel(
+            id=uuid.UUID(int=rng.getrandbits(128), version=4),
+            **{
+                f"name_{lang}": GENRES[lang][index % len(GENRES[lang])] + (f" {suffix}" if suffix else "")
+                for lang in LANGUAGES
+            },
+        ))
+    GenreModel.objects.bulk_create(genre_objects, batch_size=batch_size)
+
+    book_ids = []
+    batch = []
+    for _ in range(books):
+        title_words = rng.sample(range(len(WORDS["en"])), 3)
+        description_words = [rng.randrange(len(WORDS["en"])) for _ in range(20)]
+        author = rng.randrange(len(AUTHORS["en"]))
+        book = BookModel(
+            id=uuid.UUID(int=rng.getrandbits(128), version=4),
+            genre_id=rng.choice(genre_objects).id,
+            year=rng.randint(1900, 2025),
+            language=rng.choice(book_languages),
+            **{
+                f"{field}_{lang}": value
+                for lang in LANGUAGES
+                for field, value in (
+                    ("title", " ".join(WORDS[lang][i] for i in title_words).capitalize()),
+                    ("author", AUTHORS[lang][author]),
+                    ("description", " ".join(WORDS[lang][i] for i in description_words)),
+                )
+            },
+        )
+        batch.append(book)
+        book_ids.append(book.id)
+        if len(batch) >= batch_size:
+            BookModel.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        BookModel.objects.bulk_create(batch)
+
+    return [genre.id for genre in genre_objects], book_ids
@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .keywords import STOP_WORDS, TOKEN_RE, stem
+from .models import BookModel
+from .response_cache import get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+# Title terms count double so a query matching the title outranks one that
+# only matches somewhere in the description.
+FIELD_WEIGHTS = (("title", 2.0), ("description", 1.0))
+UNSYNCED = object()
+
+
+def text_features(text, language):
+    # Stemmed words plus their character trigrams; the trigrams let Uzbek and
+    # Russian inflections that the stemmer misses still share dimensions.
+    stop_words = STOP_WORDS.get(language, set())
+    for token in TOKEN_RE.findall(text.lower()):
+        token = token.strip("'ʻʼ‘’-")
+        if len(token) < 2 or token.isdigit() or token in stop_words:
+            continue
+        word = stem(token, language)
+        yield f"w:{word}"
+        padded = f"<{word}>"
+        for index in range(len(padded) - 2):
+            yield f"c:{padded[index:index + 3]}"
+
+
+def term_counts(fields, language, dim):
+    # Hashing trick: crc32 is stable across processes, unlike hash().
+    counts = np.zeros(dim, dtype=np.float32)
+    for text, weight in fields:
+        for feature in text_features(text or "", language):
+            counts[zlib.crc32(feature.encode()) % dim] += weight
+    return counts
+
+
+def book_fields(row, language):
+    return [(row[f"{field}_{language}"], weight) for field, weight in FIELD_WEIGHTS]
+
+
+def weigh(counts, idf):
+    vectors = np.log1p(counts) * idf
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def fill_rows(matrix, vectors):
+    for row, vector in enumerate(vectors):
+        matrix[row] = vector
+    return matrix
+
+
+def build_index(directory, language, dim, chunk_size=2000):
+    # Writes a new generation directory and then atomically repoints
+    # <language>.json at it, so running processes keep serving the old
+    # matrix until they notice the switch.
+    started_at = timezone.now()
+    fields = ["id", *[f"{field}_{language}" for field, weight in FIELD_WEIGHTS]]
+    queryset = BookModel.objects.order_by()
+    # The term counts are written straight into the output file, one chunk
+    # at a time, and weighted there in place once the document frequencies
+    # are known: the matrix is never held in memory. Books added during the
+    # build wait for the next one (the slice); if books are deleted, the
+    # trailing rows stay zero and LanguageIndex ignores them.
+    expected = queryset.count()
+
+    os.makedirs(directory, exist_ok=True)
+    generation = f"{language}-{time.time_ns()}"
+    path = os.path.join(directory, generation)
+    os.makedirs(path)
+    vectors = np.lib.format.open_memmap(
+        os.path.join(path, "vectors.npy"), mode="w+", dtype=np.float32, shape=(expected, dim),
+    )
+    ids = []
+    document_frequency = np.zeros(dim, dtype=np.int64)
+    chunk = np.zeros((chunk_size, dim), dtype=np.float32)
+    for row in queryset.values(*fields)[:expected].iterator(chunk_size=chunk_size):
+        chunk[len(ids) % chunk_size] = term_counts(book_fields(row, language), language, dim)
+        ids.append(row["id"].bytes)
+        if len(ids) % chunk_size == 0:
+            vectors[len(ids) - chunk_size:len(ids)] = chunk
+            document_frequency += np.count_nonzero(chunk, axis=0)
+    remainder = len(ids) % chunk_size
+    if remainder:
+        vectors[len(ids) - remainder:len(ids)] = chunk[:remainder]
+        document_frequency += np.count_nonzero(chunk[:remainder], axis=0)
+    idf = (np.log((1 + len(ids)) / (1 + document_frequency)) + 1).astype(np.float32)
+    for start in range(0, len(ids), chunk_size):
+        vectors[start:start + chunk_size] = weigh(vectors[start:start + chunk_size], idf)
+    vectors.flush()
+    del vectors
+    np.save(os.path.join(path, "ids.npy"), np.array(ids, dtype="S16"))
+    np.save(os.path.join(path, "idf.npy"), idf)
+
+    pointer = os.path.join(directory, f"{language}.json")
+    previous = _read_pointer(pointer)
+    temporary = f"{pointer}.tmp"
+    with open(temporary, "w", encoding="utf-8") as output:
+        json.dump({"generation": generation, "dim": dim, "count": len(ids),
+                   "built_at": started_at.isoformat()}, output)
+    os.replace(temporary, pointer)
+    if previous:
+        shutil.rmtree(os.path.join(directory, previous["generation"]), ignore_errors=True)
+    return len(ids)
+
+
+def _read_pointer(pointer):
+    try:
+        with open(pointer, encoding="utf-8") as source:
+            return json.load(source)
+    except (OSError, ValueError):
+        return None
+
+
+class LanguageIndex:
+    def __init__(self, dim, meta=None, path=None, max_delta=2000):
+        self.meta = meta
+        self.max_delta = max_delta
+        self.built_at = parse_datetime(meta["built_at"]) if meta else None
+        if path is not None:
+            # An empty array cannot be memory-mapped.
+            vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r" if meta["count"] else None)
+            self.idf = np.load(os.path.join(path, "idf.npy"))
+            ids = np.load(os.path.join(path, "ids.npy"))
+            ids = [uuid.UUID(bytes=value.ljust(16, b"\0")) for value in ids]
+            # Books deleted during the build leave zero rows at the end.
+            vectors = vectors[:len(ids)]
+        else:
+            vectors = np.zeros((0, dim), dtype=np.float32)
+            self.idf = np.ones(dim, dtype=np.float32)
+            ids = []
+        # (ids, row of each id, matrix), swapped as a whole by compact().
+        self.base = (ids, {book_id: row for row, book_id in enumerate(ids)}, vectors)
+        # Books saved or deleted after the matrix was built; a None vector
+        # marks a deleted book. Replaced rather than mutated, so a search
+        # running in another thread keeps a consistent view.
+        self.delta = {}
+        self.synced_at = self.built_at
+        # get_catalog_version() is None under DummyCache or when the cache is
+        # down, so None cannot mean "never synced".
+        self.version = UNSYNCED
+        self._delta_matrix = None
+
+    def merge(self, vectors):
+        self.delta = {**self.delta, **vectors}
+        if len(self.delta) > self.max_delta:
+            self.compact()
+
+    def compact(self):
+        # Folds the delta into an in-memory copy of the matrix, so neither the
+        # delta nor the per-search cost of stacking it grows without bound
+        # until the next build_semantic_index. The base is swapped before the
+        # delta is cleared: a search in between sees the delta rows twice,
+        # and the delta ones win, as for any changed book.
+        ids, rows, vectors = self.base
+        delta = self.delta
+        keep = [row for row, book_id in enumerate(ids) if book_id not in delta]
+        live = [(book_id, vector) for book_id, vector in delta.items() if vector is not None]
+        # Allocated once and filled in place: no intermediate copies of the
+        # kept rows or of the stacked delta.
+        matrix = np.empty((len(keep) + len(live), vectors.shape[1]), dtype=np.float32)
+        np.take(vectors, keep, axis=0, out=matrix[:len(keep)])
+        fill_rows(matrix[len(keep):], [vector for book_id, vector in live])
+        ids = [ids[row] for row in keep] + [book_id for book_id, vector in live]
+        self.base = (ids, {book_id: row for row, book_id in enumerate(ids)}, matrix)
+        self.delta = {}
+
+    def search(self, query_vector, limit):
+        base_ids, rows, vectors = self.base
+        delta = self.delta
+        cached = self._delta_matrix
+        if cached is None or cached[0] is not delta:
+            live = [(book_id, vector) for book_id, vector in delta.items() if vector is not None]
+            matrix = fill_rows(
+                np.empty((len(live), len(query_vector)), dtype=np.float32), [vector for book_id, vector in live],
+            )
+            cached = self._delta_matrix = (delta, [book_id for book_id, vector in live], matrix)
+        delta_ids, delta_vectors = cached[1], cached[2]
+
+        scores = np.asarray(vectors @ query_vector)
+        stale = [rows[book_id] for book_id in delta if book_id in rows]
+        if stale:
+            scores[stale] = 0
+        ids = base_ids + delta_ids
+        scores = np.concatenate([scores, delta_vectors @ query_vector])
+
+        limit = min(limit, len(scores))
+        if not limit:
+            return []
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[row], float(scores[row])) for row in top if scores[row] > 0]
+
+
+class SemanticIndex:
+    # Offline semantic search: hashed, TF-IDF weighted bag-of-features
+    # vectors of each book's title and description, one matrix per language,
+    # memory-mapped from disk so worker processes share the pages. Queries
+    # are answered by brute-force cosine similarity over the matrix.
+    #
+    # build_semantic_index writes the matrices. Books saved since then are
+    # embedded into a per-process delta: in the saving process by the
+    # post_save signal, in every other process by re-reading books updated
+    # since the last sync whenever the catalog version changes.
+
+    def __init__(self, directory, languages, dim, max_delta=2000):
+        self.directory = directory
+        self.languages = tuple(languages)
+        self.dim = dim
+        self.max_delta = max_delta
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def search(self, query, language, limit=50):
+        index = self._get_index(language)
+        counts = term_counts([(query, 1.0)], language, self.dim)
+        if not counts.any():
+            return []
+        return index.search(weigh(counts, index.idf).astype(np.float32), limit)
+
+    def update(self, book):
+        # Only languages already loaded in this process; the others are
+        # synced from the database when they are first used.
+        row = {f"{field}_{language}": getattr(book, f"{field}_{language}")
+               for field, weight in FIELD_WEIGHTS for language in self.languages}
+        with self._lock:
+            for language, index in self._indexes.items():
+                counts = term_counts(book_fields(row, language), language, self.dim)
+                index.merge({book.pk: weigh(counts, index.idf).astype(np.float32)})
+
+    def discard(self, book_id):
+        with self._lock:
+            for index in self._indexes.values():
+                index.merge({book_id: None})
+
+    def _get_index(self, language):
+        version = get_catalog_version()
+        index = self._indexes.get(language)
+        if index is not None and index.version == version:
+            return index
+        with self._lock:
+            index = self._indexes.get(language)
+            meta = _read_pointer(os.path.join(self.directory, f"{language}.json"))
+            if index is None or meta != index.meta:
+                index = self._load(language, meta)
+                self._indexes[language] = index
+            if index.version != version:
+                self._sync(index, language)
+                index.version = version
+            return index
+
+    def _load(self, language, meta):
+        if meta is None or meta["dim"] != self.dim:
+            logger.warning(
+                "No semantic index for %r in %s; embedding the catalog in memory. "
+                "Run `manage.py build_semantic_index`.", language, self.directory,
+            )
+            return LanguageIndex(self.dim, max_delta=self.max_delta)
+        return LanguageIndex(self.dim, meta, os.path.join(self.directory, meta["generation"]), self.max_delta)
+
+    def _sync(self, index, language):
+        fields = ["id", "updated_at", *[f"{field}_{language}" for field, weight in FIELD_WEIGHTS]]
+        books = BookModel.objects.order_by()
+        if index.synced_at is not None:
+            # >= rather than >: rows sharing the boundary timestamp are simply
+            # embedded again.
+            books = books.filter(updated_at__gte=index.synced_at)
+        vectors = {}
+        synced_at = index.synced_at
+        for row in books.values(*fields).iterator(chunk_size=2000):
+            counts = term_counts(book_fields(row, language), language, self.dim)
+            vectors[row["id"]] = weigh(counts, index.idf).astype(np.float32)
+            if synced_at is None or row["updated_at"] > synced_at:
+                synced_at = row["updated_at"]
+        index.merge(vectors)
+        index.synced_at = synced_at
+
+
+semantic_index = SemanticIndex(
+    directory=settings.SEMANTIC_INDEX_DIR,
+    languages=settings.MODELTRANSLATION_LANGUAGES,
+    dim=settings.SEMANTIC_INDEX_DIM,
+    max_delta=settings.SEMANTIC_INDEX_MAX_DELTA,
+)
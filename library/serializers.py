@@ -1,9 +1,49 @@
 from django.conf import settings
+from django.utils.functional import cached_property
 from rest_framework import serializers
+from .genres import genre_index, genre_representation
+from .images import variant_exists, variant_names
 from .models import GenreModel, BookModel, SearchHistory
 
 
 def get_lang_from_request(request):
+    # The resolved language is memoized on the request, so nested and
+    # many=True serializers resolve it once per request instead of per row.
+    cached = getattr(request, "_resolved_lang", None)
+    if cached:
+        return cached
+    resolved = _resolve_lang(request)
+    if request:
+        request._resolved_lang = resolved
+    return resolved
+
+
+def media_url(name, request=None):
+    if not name:
+        return None
+    url = BookModel._meta.get_field("image").storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+def image_variant_urls(name, request=None):
+    # Variants are rendered in the background after an upload (or by
+    # generate_book_images); until a file exists its URL points at the
+    # original image, which always loads.
+    if not name:
+        return None
+    storage = BookModel._meta.get_field("image").storage
+    original = media_url(name, request)
+    missing_ttl = settings.BOOK_IMAGE_MISSING_TTL
+    return {
+        variant: {
+            extension: media_url(path, request) if variant_exists(storage, path, missing_ttl) else original
+            for extension, path in paths.items()
+        }
+        for variant, paths in variant_names(name, settings.BOOK_IMAGE_VARIANTS).items()
+    }
+
+
+def _resolve_lang(request):
     default_lang = getattr(settings, "MODELTRANSLATION_DEFAULT_LANGUAGE", "en")
     lang_options = getattr(settings, "MODELTRANSLATION_LANGUAGES",
                            [code for code, _ in getattr(settings, "LANGUAGES", [])])
@@ -36,13 +76,17 @@ class GenreSerializer(serializers.ModelSerializer):
 
 class BookSerializer(serializers.ModelSerializer):
     genre = GenreSerializer(read_only=True)
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = BookModel
-        fields = ["id", "author", "title", "description", "genre", "year", "language", "image", "youtube_url",
-                  "library_url", "store_url",
+        fields = ["id", "author", "title", "description", "genre", "year", "language", "image", "image_variants",
+                  "youtube_url", "library_url", "store_url",
                   ]
 
+    def get_image_variants(self, instance):
+        return image_variant_urls(instance.image.name, self.context.get("request"))
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
         request = self.context.get("request")
@@ -58,6 +102,48 @@ class BookSerializer(serializers.ModelSerializer):
             data["description"] = description_translated
         return data
 
+class BookRowSerializer(serializers.BaseSerializer):
+    # Read-only fast path for book lists. It renders the dicts produced by
+    # book_rows() into the same shape as BookSerializer without building
+    # model instances or running per-field DRF machinery.
+
+    @staticmethod
+    def book_rows(queryset, lang):
+        return queryset.values(
+            "id", "created_at", "title", f"title_{lang}", "author", f"author_{lang}", "description",
+            f"description_{lang}", "genre_id", "year", "language", "image",
+            "youtube_url", "library_url", "store_url",
+        )
+
+    def to_representation(self, row):
+        lang = self.lang
+        return {
+            "id": str(row["id"]),
+            "author": row[f"author_{lang}"] or row["author"],
+            "title": row[f"title_{lang}"] or row["title"],
+            "description": row[f"description_{lang}"] or row["description"],
+            "genre": genre_representation(
+                self.genres.get(row["genre_id"]) or genre_index.get(row["genre_id"]), lang
+            ),
+            "year": row["year"],
+            "language": row["language"],
+            "image": media_url(row["image"], self.context.get("request")),
+            "image_variants": image_variant_urls(row["image"], self.context.get("request")),
+            "youtube_url": row["youtube_url"],
+            "library_url": row["library_url"],
+            "store_url": row["store_url"],
+        }
+
+    @cached_property
+    def genres(self):
+        return genre_index.snapshot()
+
+    @cached_property
+    def lang(self):
+        lang, lang_options = get_lang_from_request(self.context.get("request"))
+        return lang
+
+
 class SearchHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = SearchHistory
@@ -69,4 +155,8 @@ class SearchRequestSerializer(serializers.Serializer):
     language = serializers.ChoiceField(
         choices=[("uz", "Uzbek"), ("ru", "Russian"), ("en", "English")],
         default="uz"
+    )
+    mode = serializers.ChoiceField(
+        choices=[("keywords", "Keywords"), ("semantic", "Semantic")],
+        default="keywords"
     )
\ No newline at end of file
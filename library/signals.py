@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .autocomplete import autocomplete_index
+from .genres import genre_index
+from .models import BookModel, GenreModel, SearchRequestModel
+from .response_cache import bump_catalog_version
+from .retention import is_partitioned, unsupported_operations
+
+
+def create_postgres_extensions(using=DEFAULT_DB_ALIAS, **kwargs):
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+
+def deduplicate_search_requests(using=DEFAULT_DB_ALIAS, **kwargs):
+    # Databases created before the keyword cache can hold several rows per
+    # (query, language), and adding search_request_query_language_uniq
+    # would then fail. Migrations are generated at deploy time, so this runs
+    # before migrate instead of as a RunPython step: while the constraint is
+    # missing, only the most recently updated row of each pair is kept.
+    connection = connections[using]
+    table = SearchRequestModel._meta.db_table
+    constraint = SearchRequestModel._meta.constraints[0].name
+    with connection.cursor() as cursor:
+        if table not in connection.introspection.table_names(cursor):
+            return
+        if constraint in connection.introspection.get_constraints(cursor, table):
+            return
+        cursor.execute(
+            f"""
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY query, language ORDER BY updated_at DESC, id DESC
+                    ) AS position
+                    FROM {table}
+                ) AS ranked
+                WHERE position > 1
+            )
+            """
+        )
+
+
+def guard_partitioned_search_history(plan=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    # partition_search_history --convert changes the table behind the
+    # migration state's back; stop migrate before it half-applies an
+    # operation the partitioned table cannot take.
+    if not plan or connections[using].vendor != "postgresql":
+        return
+    unsupported = list(unsupported_operations(plan))
+    if unsupported and is_partitioned(using):
+        raise CommandError(
+            "search_history is partitioned (primary key (id, created_at)) and these operations cannot be "
+            "applied to it: "
+            + "; ".join(f"{migration.app_label}.{migration.name}: {operation.describe()}"
+                        for migration, operation in unsupported)
+            + ". Apply the change to the partitioned table by hand and fake the migration."
+        )
+
+
+@receiver([post_save, post_delete], sender=BookModel)
+@receiver([post_save, post_delete], sender=GenreModel)
+def invalidate_catalog_cache(sender, **kwargs):
+    # Bumped after commit, otherwise a concurrent request could cache the old
+    # rows under the new version.
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver([post_save, post_delete], sender=GenreModel)
+def invalidate_genre_index(sender, **kwargs):
+    transaction.on_commit(genre_index.invalidate)
+
+
+@receiver(post_save, sender=BookModel)
+def generate_book_image_variants(sender, instance, **kwargs):
+    if not instance.image:
+        return
+    name, storage = instance.image.name, instance.image.storage
+
+    def schedule():
+        from .images import schedule_variants
+
+        future = schedule_variants(name, storage, settings.BOOK_IMAGE_VARIANTS, settings.BOOK_IMAGE_WORKERS)
+        if future is not None:
+            # Cached responses still point the variants at the original image.
+            future.add_done_callback(lambda done: bump_catalog_version())
+
+    transaction.on_commit(schedule)
+
+
+@receiver(post_save, sender=BookModel)
+def update_semantic_index(sender, instance, **kwargs):
+    # Imported on first use: numpy stays out of AppConfig.ready().
+    from .semantic import semantic_index
+
+    transaction.on_commit(lambda: semantic_index.update(instance))
+
+
+@receiver(post_delete, sender=BookModel)
+def discard_from_semantic_index(sender, instance, **kwargs):
+    from .semantic import semantic_index
+
+    book_id = instance.pk
+    transaction.on_commit(lambda: semantic_index.discard(book_id))
+
+
+@receiver(post_save, sender=BookModel)
+def update_autocomplete_book(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete_index.update_book(instance))
+
+
+@receiver(post_delete, sender=BookModel)
+def remove_autocomplete_book(sender, instance, **kwargs):
+    book_id = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove_book(book_id))
+
+
+@receiver(post_save, sender=GenreModel)
+def update_autocomplete_genre(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete_index.update_genre(instance))
+
+
+@receiver(post_delete, sender=GenreModel)
+def remove_autocomplete_genre(sender, instance, **kwargs):
+    genre_id = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove_genre(genre_id))
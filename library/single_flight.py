@@ -0,0 +1,49 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    # Coalesces concurrent calls with the same key into one: the first caller
+    # runs the coroutine, later callers await its result. The shared futures
+    # are concurrent.futures ones, so callers on other threads and event
+    # loops (async_to_sync starts one per sync request) can wait on them too.
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key, coroutine_function, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # The leader was cancelled (e.g. its client went away), not
+                # this caller: run the call on our own.
+                if future.cancelled():
+                    return await coroutine_function(*args, **kwargs)
+                raise
+
+        try:
+            result = await coroutine_function(*args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def __len__(self):
+        return len(self._calls)
@@ -1,3 +1,901 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection, migrations, models
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authentication.authentication import get_user_cache, user_cache_key
+from authentication.models import UserModel
+
+from . import retention, semantic, utils
+from .autocomplete import AutocompleteIndex
+from .circuit_breaker import CircuitBreaker
+from .genres import GenreIndex, genre_index
+from .history import SearchHistoryBuffer
+from .images import forget_missing_variants, variant_exists, variant_name
+from .keyword_cache import KeywordCache
+from .keywords import extract_keywords
+from .models import BookModel, GenreModel, SearchHistory, SearchRequestModel
+from .pagination import BookCursorPagination
+from .response_cache import bump_catalog_version, get_catalog_version, request_fingerprint
+from .retention import prune_users
+from .search import keyword_books
+from .seed import seed_catalog
+from .semantic import SemanticIndex
+from .serializers import image_variant_urls
+from .signals import deduplicate_search_requests
+from .single_flight import SingleFlight
+from .throttling import SearchThrottle, TokenBucket
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "EXPLAIN output is PostgreSQL specific")
+class HotQueryIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(genres=10, books=2000, seed=1)
+        cls.user = UserModel.objects.create_user(email="reader@example.com")
+        other = UserModel.objects.create_user(email="other@example.com")
+        SearchHistory.objects.bulk_create(
+            [SearchHistory(user=cls.user if i % 10 == 0 else other, query=f"query {i}") for i in range(2000)]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE book")
+            cursor.execute("ANALYZE search_history")
+
+    def explain(self, queryset):
+        # The seeded tables are small enough that a sequential scan can win on
+        # cost alone; disabling it checks that a usable index exists.
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        return queryset.explain()
+
+    def test_search_history_uses_user_index(self):
+        plan = self.explain(
+            SearchHistory.objects.filter(user=self.user).only("id", "query", "created_at").order_by("-created_at")[:20]
+        )
+        self.assertIn("search_history_user_idx", plan)
+        self.assertNotIn("Sort", plan)
+
+    def test_book_language_year_filter_uses_index(self):
+        plan = self.explain(BookModel.objects.filter(language="en", year=1999).order_by())
+        self.assertIn("book_language_year_idx", plan)
+        self.assertNotIn("Seq Scan", plan)
+
+    def test_book_year_filter_uses_index(self):
+        plan = self.explain(BookModel.objects.filter(year=1999).order_by())
+        self.assertIn("book_year_idx", plan)
+        self.assertNotIn("Seq Scan", plan)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "Pruning uses PostgreSQL window queries")
+class SearchHistoryRetentionTests(TestCase):
+    def test_prune_users_keeps_newest_rows(self):
+        user = UserModel.objects.create_user(email="reader@example.com")
+        other = UserModel.objects.create_user(email="other@example.com")
+        SearchHistory.objects.bulk_create(
+            [SearchHistory(user=user, query=f"query {i}") for i in range(30)]
+            + [SearchHistory(user=other, query=f"other {i}") for i in range(5)]
+        )
+        newest = list(
+            SearchHistory.objects.filter(user=user).order_by("-created_at", "-id").values_list("id", flat=True)[:10]
+        )
+
+        deleted = prune_users([user.id, other.id], keep=10, batch_size=7)
+
+        self.assertEqual(deleted, 20)
+        self.assertEqual(set(SearchHistory.objects.filter(user=user).values_list("id", flat=True)), set(newest))
+        self.assertEqual(SearchHistory.objects.filter(user=other).count(), 5)
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "Partitioning is PostgreSQL specific")
+    def test_new_partition_takes_rows_from_default_partition(self):
+        user = UserModel.objects.create_user(email="reader@example.com")
+        SearchHistory.objects.create(user=user, query="now")
+        retention.convert_to_partitioned(months_ahead=0)
+        later = SearchHistory.objects.create(user=user, query="later")
+        SearchHistory.objects.filter(pk=later.pk).update(created_at=timezone.now() + timedelta(days=70))
+
+        created = retention.ensure_partitions(months_ahead=3)
+
+        self.assertEqual(len(created), 3)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {retention.TABLE}_default")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertEqual(SearchHistory.objects.count(), 2)
+
+    def test_unsupported_operations_on_partitioned_table(self):
+        migration = migrations.Migration("0009_change", "library")
+        migration.operations = [
+            migrations.AddField("searchhistory", "source", models.CharField(max_length=20, default="")),
+            migrations.AlterField("searchhistory", "id", models.UUIDField(primary_key=True)),
+            migrations.AddConstraint(
+                "searchhistory", models.UniqueConstraint(fields=["user", "query"], name="history_uniq"),
+            ),
+            migrations.AlterField("bookmodel", "id", models.UUIDField(primary_key=True)),
+            migrations.AlterField("searchhistory", "created_at", models.DateTimeField(default=timezone.now)),
+            migrations.AlterField("searchhistory", "created_at", models.DateTimeField(null=True)),
+        ]
+        unsupported = [operation for _, operation in retention.unsupported_operations([(migration, False)])]
+        self.assertEqual(unsupported, [*migration.operations[1:3], migration.operations[5]])
+
+    @mock.patch.object(SearchHistoryBuffer, "_ensure_worker")
+    def test_delayed_flush_keeps_search_time(self, ensure_worker):
+        user = UserModel.objects.create_user(email="reader@example.com")
+        buffer = SearchHistoryBuffer(max_size=100, batch_size=100, flush_interval=60)
+        searched_at = timezone.now() - timedelta(minutes=5)
+        for minute, query in enumerate(["first", "second", "third"]):
+            with mock.patch("library.history.timezone.now", return_value=searched_at + timedelta(minutes=minute)):
+                buffer.add(user.pk, query, "en")
+
+        self.assertEqual(buffer.flush(), 3)
+        rows = SearchHistory.objects.filter(user=user).order_by("-created_at").values_list("query", "created_at")
+        self.assertEqual(list(rows), [
+            ("third", searched_at + timedelta(minutes=2)),
+            ("second", searched_at + timedelta(minutes=1)),
+            ("first", searched_at),
+        ])
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_on_other_threads_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        async def lookup(query):
+            calls.append(query)
+            await asyncio.sleep(0.2)
+            return [query]
+
+        # async_to_sync runs each call in its own event loop.
+        threads = [
+            threading.Thread(target=lambda: results.append(async_to_sync(flight.do)("key", lookup, "war")))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, ["war"])
+        self.assertEqual(results, [["war"]] * 4)
+        self.assertEqual(len(flight), 0)
+
+    def test_concurrent_calls_on_one_loop_share_one_call_and_its_error(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def lookup(query):
+            calls.append(query)
+            await asyncio.sleep(0.05)
+            if query == "broken":
+                raise ValueError(query)
+            return [query]
+
+        async def run():
+            shared = await asyncio.gather(*[flight.do("war", lookup, "war") for _ in range(3)])
+            other = await flight.do("peace", lookup, "peace")
+            failed = await asyncio.gather(*[flight.do("broken", lookup, "broken") for _ in range(2)],
+                                          return_exceptions=True)
+            return shared, other, failed
+
+        shared, other, failed = asyncio.run(run())
+        self.assertEqual(shared, [["war"]] * 3)
+        self.assertEqual(other, ["peace"])
+        self.assertEqual([type(error) for error in failed], [ValueError, ValueError])
+        self.assertEqual(calls, ["war", "peace", "broken"])
+        self.assertEqual(len(flight), 0)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("library.circuit_breaker.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, slow_call_threshold=1.0)
+
+    def test_opens_half_opens_and_closes(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        self.now += 29
+        self.assertFalse(self.breaker.allow())
+        self.now += 1
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        # One trial call; the others wait for its outcome.
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success(0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_or_slow_trial_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.now += 30
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success(1.5)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.now += 29
+        self.assertFalse(self.breaker.allow())
+
+
+@override_settings(
+    SEARCH_THROTTLE_USER_RATE="1/hour", SEARCH_THROTTLE_USER_BURST=3,
+    SEARCH_THROTTLE_GLOBAL_RATE="1/hour", SEARCH_THROTTLE_GLOBAL_BURST=10,
+)
+class SearchThrottleTests(TestCase):
+    def setUp(self):
+        cache = caches[settings.LIBRARY_CACHE_ALIAS]
+        cache.delete_many([f"{SearchThrottle.cache_prefix}:global"])
+        self.addCleanup(cache.delete_many, [f"{SearchThrottle.cache_prefix}:global"])
+
+    def request_as(self, user):
+        request = Request(RequestFactory().post("/search/"))
+        request.user = user
+        return request
+
+    def allowed(self, user, times):
+        return [SearchThrottle().allow_request(self.request_as(user), None) for _ in range(times)]
+
+    def test_user_over_limit_does_not_drain_global_bucket(self):
+        greedy = UserModel.objects.create_user(email="greedy@example.com")
+        other = UserModel.objects.create_user(email="other@example.com")
+        self.assertEqual(self.allowed(greedy, 50).count(True), 3)
+        self.assertEqual(self.allowed(other, 3), [True, True, True])
+
+    def test_global_bucket_limits_all_users(self):
+        users = [UserModel.objects.create_user(email=f"reader{i}@example.com") for i in range(4)]
+        results = [allowed for user in users for allowed in self.allowed(user, 3)]
+        self.assertEqual(results.count(True), 10)
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("library.throttling.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = LocMemCache("token-bucket-tests", {})
+        self.addCleanup(self.cache.clear)
+
+    def bucket(self, key, burst, rate=1.0):
+        return TokenBucket(self.cache, key, rate, burst)
+
+    def tokens(self, key):
+        return self.cache.get(key)[0]
+
+    def test_refills_at_rate_up_to_burst(self):
+        bucket = self.bucket("user", burst=2)
+        self.assertIsNone(bucket.take())
+        self.assertIsNone(bucket.take())
+        self.assertEqual(bucket.take(), 1.0)
+        self.now += 0.5
+        self.assertEqual(bucket.take(), 0.5)
+        self.now += 0.5
+        self.assertIsNone(bucket.take())
+
+        self.now += 3600
+        self.assertIsNone(bucket.take())
+        self.assertIsNone(bucket.take())
+        self.assertIsNotNone(bucket.take())
+
+    def test_empty_user_bucket_rejects_without_touching_global(self):
+        user, shared = self.bucket("user", burst=1), self.bucket("global", burst=5)
+        throttle = SearchThrottle()
+        with mock.patch.object(throttle, "get_buckets", return_value=[user, shared]):
+            self.assertTrue(throttle.allow_request(None, None))
+            self.assertFalse(throttle.allow_request(None, None))
+        self.assertEqual(throttle.wait(), 1.0)
+        self.assertEqual(self.tokens("global"), 4)
+
+    def test_token_is_given_back_when_global_bucket_rejects(self):
+        user, shared = self.bucket("user", burst=3), self.bucket("global", burst=1, rate=0.5)
+        self.assertIsNone(shared.take())
+        throttle = SearchThrottle()
+        with mock.patch.object(throttle, "get_buckets", return_value=[user, shared]):
+            self.assertFalse(throttle.allow_request(None, None))
+        self.assertEqual(throttle.wait(), 2.0)
+        self.assertEqual(self.tokens("user"), 3)
+
+
+class GenreIndexTests(TestCase):
+    @mock.patch("library.genres.get_catalog_version", return_value=None)
+    def test_loads_without_catalog_version(self, get_catalog_version):
+        # DummyCache, or a cache that is down, has no version.
+        genre = GenreModel.objects.create(name="Fantasy", name_en="Fantasy", name_uz="Fantastika")
+        index = GenreIndex(settings.MODELTRANSLATION_LANGUAGES)
+        self.assertEqual(index.ids_matching("fantas"), [genre.pk])
+        self.assertEqual(index.get(genre.pk)["name_uz"], "Fantastika")
+
+
+class SemanticIndexTests(TestCase):
+    def setUp(self):
+        seed_catalog(genres=2, books=20, seed=3)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.index = SemanticIndex(directory.name, settings.MODELTRANSLATION_LANGUAGES, dim=256, max_delta=5)
+        self.book = BookModel.objects.order_by("id").first()
+
+    @mock.patch("library.semantic.get_catalog_version", return_value=None)
+    def test_embeds_catalog_without_catalog_version(self, get_catalog_version):
+        results = self.index.search(self.book.title_en, "en", limit=5)
+        self.assertIn(self.book.pk, [book_id for book_id, score in results])
+
+    def test_delta_is_folded_into_matrix(self):
+        self.index.search("book", "en")
+        index = self.index._indexes["en"]
+        self.assertEqual(index.delta, {})
+        self.assertEqual(len(index.base[0]), 20)
+
+        for book in BookModel.objects.all()[:4]:
+            self.index.update(book)
+        self.assertEqual(len(index.delta), 4)
+        self.index.discard(self.book.pk)
+        self.index.update(BookModel.objects.order_by("id").last())
+        self.assertEqual(index.delta, {})
+        self.assertEqual(len(index.base[0]), 19)
+        results = self.index.search(self.book.title_en, "en", limit=20)
+        self.assertNotIn(self.book.pk, [book_id for book_id, score in results])
+
+    def test_chunked_build_matches_whole_matrix(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.assertEqual(semantic.build_index(directory.name, "en", 256, chunk_size=7), 20)
+        meta = semantic._read_pointer(os.path.join(directory.name, "en.json"))
+        path = os.path.join(directory.name, meta["generation"])
+        ids = [uuid.UUID(bytes=value) for value in np.load(os.path.join(path, "ids.npy"))]
+
+        books = BookModel.objects.in_bulk(ids)
+        counts = np.vstack([
+            semantic.term_counts([(books[book_id].title_en, 2.0), (books[book_id].description_en, 1.0)], "en", 256)
+            for book_id in ids
+        ])
+        idf = (np.log(21 / (1 + np.count_nonzero(counts, axis=0))) + 1).astype(np.float32)
+        np.testing.assert_allclose(np.load(os.path.join(path, "vectors.npy")), semantic.weigh(counts, idf),
+                                      rtol=1e-5)
+
+
+class ImportBooksTests(TestCase):
+    def test_malformed_jsonl_lines_are_skipped(self):
+        book = {"title_en": "Dune", "author_en": "Frank Herbert", "description_en": "Spice.",
+                "genre": "Science fiction", "year": 1965, "language": "en"}
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", encoding="utf-8", delete=False) as source:
+            source.write(json.dumps(book) + "\n")
+            source.write('{"title_en": "broken\n')
+            source.write("[]\n")
+            source.write('"text"\n')
+            source.write(json.dumps({**book, "title_en": "Dune Messiah", "year": 1969}) + "\n")
+        self.addCleanup(os.unlink, source.name)
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("import_books", source.name, stdout=stdout, stderr=stderr)
+        self.assertEqual(
+            sorted(BookModel.objects.values_list("title_en", flat=True)), ["Dune", "Dune Messiah"],
+        )
+        self.assertIn("2 books (3 skipped", stdout.getvalue())
+        self.assertEqual(stderr.getvalue().count("Skipping record"), 3)
+
+
+class GeminiLazyLoadTests(SimpleTestCase):
+    def test_cold_sdk_load_is_not_timed(self):
+        class Model:
+            async def generate_content_async(self, prompt):
+                return mock.Mock(text="war, peace")
+
+        def slow_load(language):
+            time.sleep(0.3)
+            return utils._gemini_models.setdefault(language, Model())
+
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, slow_call_threshold=0.2)
+        with mock.patch.dict(utils._gemini_models, clear=True), \
+                mock.patch.object(utils, "_gemini_model", slow_load), \
+                mock.patch.object(utils, "gemini_breaker", breaker), \
+                mock.patch.object(utils.keyword_cache, "aget", mock.AsyncMock(return_value=None)), \
+                mock.patch.object(utils.keyword_cache, "aset", mock.AsyncMock()), \
+                self.settings(GEMINI_TIMEOUT=0.2):
+            keywords, source = async_to_sync(utils._resolve_keywords_async)("war and peace", "en")
+        self.assertEqual((keywords, source), (["war", "peace"], "ai"))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class KeywordCacheTests(TestCase):
+    def setUp(self):
+        self.cache = KeywordCache(maxsize=100, memory_ttl=600, db_ttl=3600, db_max_entries=50)
+        self.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, slow_call_threshold=5)
+        self.model = mock.Mock(generate_content_async=mock.AsyncMock(return_value=mock.Mock(text="war, peace")))
+        for patcher in (
+            mock.patch.object(utils, "keyword_cache", self.cache),
+            mock.patch.object(utils, "gemini_breaker", self.breaker),
+            mock.patch.object(utils, "_load_gemini_model", mock.AsyncMock(return_value=self.model)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def resolve(self, query, language="en"):
+        return async_to_sync(utils._resolve_keywords_async)(query, language)
+
+    def test_memory_hit_needs_no_query(self):
+        self.cache.set("War  and Peace", "en", ["war", "peace"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.get("war and peace", "en"), ["war", "peace"])
+        self.assertEqual(self.cache.stats["memory_hits"], 1)
+
+    def test_database_hit_skips_gemini(self):
+        SearchRequestModel.objects.create(query="war and peace", language="en", keywords=["war", "peace"])
+        self.assertEqual(self.resolve("War and peace"), (["war", "peace"], "cache"))
+        self.model.generate_content_async.assert_not_called()
+        self.assertEqual(self.cache.stats["db_hits"], 1)
+        # The database hit fills the memory tier.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve("war and peace"), (["war", "peace"], "cache"))
+
+    def test_gemini_timeout_falls_back_to_local_keywords(self):
+        async def slow(prompt):
+            await asyncio.sleep(1)
+
+        self.model.generate_content_async.side_effect = slow
+        with self.settings(GEMINI_TIMEOUT=0.05):
+            keywords, source = self.resolve("war and peace")
+        self.assertEqual((keywords, source), (extract_keywords("war and peace", "en"), "local"))
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(SearchRequestModel.objects.exists())
+
+    def test_open_breaker_falls_back_without_calling_gemini(self):
+        self.breaker.record_failure()
+        self.assertEqual(self.resolve("war and peace"), (extract_keywords("war and peace", "en"), "local"))
+        self.model.generate_content_async.assert_not_called()
+
+    def test_database_tier_is_evicted_every_100_writes(self):
+        with mock.patch.object(self.cache, "evict", wraps=self.cache.evict) as evict:
+            for index in range(250):
+                self.cache.set(f"query {index}", "en", ["keyword"])
+        self.assertEqual(evict.call_count, 2)
+        # Trimmed to the newest 50 at the 200th write, then 50 more.
+        self.assertEqual(SearchRequestModel.objects.count(), 100)
+        self.assertTrue(SearchRequestModel.objects.filter(query="query 249").exists())
+        self.assertFalse(SearchRequestModel.objects.filter(query="query 149").exists())
+
+
+class AsyncBookSearchViewTests(TestCase):
+    sync_url = "/en/api/v1/library/search/"
+    async_url = "/en/api/v1/library/search/async/"
+
+    def setUp(self):
+        seed_catalog(genres=2, books=30, seed=9)
+        # Cold, so the async view has to load it from the database.
+        genre_index.invalidate()
+        user = UserModel.objects.create_user(email="reader@example.com", is_verified=True)
+        self.auth = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+        self.addCleanup(get_user_cache().delete, user_cache_key(user.pk))
+        cache = caches[settings.LIBRARY_CACHE_ALIAS]
+        keys = [f"{SearchThrottle.cache_prefix}:global", f"{SearchThrottle.cache_prefix}:user:{user.pk}"]
+        self.addCleanup(cache.delete_many, keys)
+        patcher = mock.patch("library.views.search_history_buffer")
+        self.history = patcher.start()
+        self.history.aadd = mock.AsyncMock()
+        self.addCleanup(patcher.stop)
+
+    async def search(self, headers=None, **data):
+        return await AsyncClient().post(self.async_url, data, content_type="application/json", headers=headers)
+
+    async def test_rejects_anonymous_and_invalid_tokens(self):
+        response = await self.search(query="war")
+        self.assertEqual(response.status_code, 401)
+        response = await self.search(headers={"Authorization": "Bearer nonsense"}, query="war")
+        self.assertEqual(response.status_code, 401)
+        self.history.aadd.assert_not_called()
+
+    async def test_gemini_timeout_falls_back_to_local_keywords(self):
+        async def slow(prompt):
+            await asyncio.sleep(1)
+
+        model = mock.Mock(generate_content_async=slow)
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60, slow_call_threshold=5)
+        cache = KeywordCache(maxsize=10, memory_ttl=60, db_ttl=60, db_max_entries=10)
+        with mock.patch.object(utils, "_load_gemini_model", mock.AsyncMock(return_value=model)), \
+                mock.patch.object(utils, "gemini_breaker", breaker), \
+                mock.patch.object(utils, "keyword_cache", cache), \
+                self.settings(GEMINI_TIMEOUT=0.05):
+            response = await self.search(self.auth, query="war and peace", language="en")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["keywords_source"], "local")
+        self.assertIn("war", data["keywords"])
+        self.history.aadd.assert_awaited_once()
+
+    def test_response_matches_sync_search(self):
+        keywords = (["war", "mountain"], "ai")
+        with mock.patch("library.views.ai_search_books", return_value=keywords), \
+                mock.patch("library.views._ai_search_books_async", mock.AsyncMock(return_value=keywords)):
+            sync_response = self.client.post(
+                self.sync_url, {"query": "war", "language": "en"}, content_type="application/json",
+                headers=self.auth,
+            )
+            async_response = async_to_sync(self.search)(self.auth, query="war", language="en")
+        self.assertEqual(sync_response.status_code, 200)
+        self.assertEqual(async_response.status_code, 200)
+        self.assertTrue(sync_response.json()["results"])
+        self.assertEqual(async_response.json(), sync_response.json())
+
+
+class StartupImportTests(SimpleTestCase):
+    def test_setup_and_url_loading_do_not_import_numpy_or_pillow(self):
+        script = (
+            "import sys, django; django.setup(); "
+            "from django.urls import get_resolver; get_resolver().url_patterns; "
+            "print(sorted(name for name in ('numpy', 'PIL') if name in sys.modules))"
+        )
+        result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        seed_catalog(genres=2, books=5, seed=4)
+
+    def test_export_streams_asynchronously_under_asgi(self):
+        sync_response = self.client.get("/en/api/v1/library/books/export/")
+        self.assertFalse(sync_response.is_async)
+
+        async def fetch():
+            response = await AsyncClient().get("/en/api/v1/library/books/export/")
+            return response, b"".join([part async for part in response])
+
+        response, content = async_to_sync(fetch)()
+        self.assertTrue(response.is_async)
+        lines = content.decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines, b"".join(sync_response.streaming_content).decode().splitlines())
+
+
+class BookListValidatorTests(TestCase):
+    def setUp(self):
+        seed_catalog(genres=2, books=5, seed=5)
+
+    def test_deleting_a_book_invalidates_the_list(self):
+        url = "/en/api/v1/library/books/"
+        response = self.client.get(url)
+        self.assertNotIn("Last-Modified", response)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BookModel.objects.order_by("created_at").first().delete()
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 4)
+
+    def test_list_queries_do_not_select_distinct(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/en/api/v1/library/books/", {"year": BookModel.objects.first().year})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json())
+        self.assertFalse([query["sql"] for query in queries if "DISTINCT" in query["sql"]])
+
+
+class ResponseCacheTests(TestCase):
+    url = "/en/api/v1/library/books/"
+
+    def setUp(self):
+        bump_catalog_version()
+        seed_catalog(genres=2, books=3, seed=8)
+        self.book = BookModel.objects.order_by("-created_at", "-id").first()
+
+    def title(self, **headers):
+        books = self.client.get(self.url, headers=headers).json()
+        return next(book["title"] for book in books if book["id"] == str(self.book.pk))
+
+    def test_saving_a_book_or_genre_bumps_the_version(self):
+        for instance in (self.book, self.book.genre):
+            version = get_catalog_version()
+            with self.captureOnCommitCallbacks(execute=True):
+                instance.save()
+            self.assertGreater(get_catalog_version(), version)
+
+    def test_list_is_served_from_cache_until_a_save(self):
+        title = self.title()
+        # A queryset update sends no signal, so the cached list is served.
+        BookModel.objects.filter(pk=self.book.pk).update(title_en="Renamed")
+        self.assertEqual(self.title(), title)
+
+        self.book.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.save()
+        self.assertEqual(self.title(), "Renamed")
+
+    def test_languages_are_cached_separately(self):
+        self.assertIn("Accept-Language", self.client.get(self.url)["Vary"])
+        self.assertEqual(self.title(**{"Accept-Language": "uz"}), self.book.title_uz)
+        self.assertEqual(self.title(**{"Accept-Language": "en"}), self.book.title_en)
+        self.assertEqual(self.title(**{"Accept-Language": "uz"}), self.book.title_uz)
+
+    def test_fingerprint(self):
+        def fingerprint(path, lang="en", **extra):
+            return request_fingerprint(Request(RequestFactory().get(path, **extra)), lang)
+
+        self.assertEqual(fingerprint("/books/?year=2001&author=Ann"), fingerprint("/books/?author=Ann&year=2001"))
+        self.assertEqual(fingerprint("/books/?search=&lang=uz"), fingerprint("/books/"))
+        self.assertNotEqual(fingerprint("/books/", "en"), fingerprint("/books/", "uz"))
+        self.assertNotEqual(fingerprint("/books/?year=2001"), fingerprint("/books/?year=2002"))
+        self.assertNotEqual(fingerprint("/books/"), fingerprint("/books/", HTTP_HOST="other.example.com"))
+
+
+class BookQueryTests(TestCase):
+    url = "/en/api/v1/library/books/"
+
+    def setUp(self):
+        bump_catalog_version()
+        seed_catalog(genres=2, books=20, seed=10)
+        genre = GenreModel.objects.first()
+        for language, year in (("en", 1899), ("uz", 1899), ("en", 1905)):
+            BookModel.objects.create(title_en=f"{language} {year}", genre=genre, language=language, year=year)
+
+    def ids(self, **params):
+        return {book["id"] for book in self.client.get(self.url, params).json()}
+
+    def expected(self, **filters):
+        return {str(pk) for pk in BookModel.objects.filter(**filters).values_list("id", flat=True)}
+
+    def test_search_vectors_are_not_selected(self):
+        book = BookModel.objects.first()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+            self.assertEqual(self.client.get(self.url, {"page_size": 5}).status_code, 200)
+            self.assertEqual(self.client.get(f"{self.url}{book.pk}/").status_code, 200)
+        selects = [query["sql"] for query in queries if '"book"' in query["sql"]]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertNotIn("search_", sql.split(" FROM ")[0])
+
+    def test_year_and_language_filters(self):
+        self.assertEqual(self.ids(year=1899), self.expected(year=1899))
+        self.assertEqual(len(self.ids(year=1899)), 2)
+        self.assertEqual(self.ids(year=1899, language="en"), self.expected(year=1899, language="en"))
+        self.assertEqual(len(self.ids(year=1899, language="en")), 1)
+        self.assertEqual(self.ids(language="uz"), self.expected(language="uz"))
+
+
+class BookPaginationTests(TestCase):
+    url = "/en/api/v1/library/books/"
+
+    def setUp(self):
+        bump_catalog_version()
+        seed_catalog(genres=2, books=5, seed=7)
+        ids = BookModel.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        self.newest_first = [str(pk) for pk in ids]
+
+    def ids(self, page):
+        return [book["id"] for book in page["results"]]
+
+    def test_next_and_previous_links(self):
+        first = self.client.get(self.url, {"page_size": 2}).json()
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).json()
+        third = self.client.get(second["next"]).json()
+        self.assertIsNone(third["next"])
+        self.assertEqual(self.ids(first) + self.ids(second) + self.ids(third), self.newest_first)
+        self.assertEqual(self.ids(self.client.get(second["previous"]).json()), self.ids(first))
+
+    def test_order_is_stable_across_inserts(self):
+        first = self.client.get(self.url, {"page_size": 3}).json()
+        genre = GenreModel.objects.first()
+        BookModel.objects.create(title_en="Brand new", author_en="Ann Writer", genre=genre, year=2020)
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(self.ids(first) + self.ids(second), self.newest_first)
+
+    @mock.patch.object(BookCursorPagination, "max_page_size", 3)
+    def test_page_size_is_clamped(self):
+        page = self.client.get(self.url, {"page_size": 1000}).json()
+        self.assertEqual(self.ids(page), self.newest_first[:3])
+        self.assertIsNotNone(page["next"])
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "Trigram similarity is PostgreSQL specific")
+    def test_fuzzy_results_keep_similarity_order(self):
+        genre = GenreModel.objects.first()
+        # Created from best to worst match, so date order would reverse them.
+        books = [
+            BookModel.objects.create(title_en=f"Book {author}", author_en=author, genre=genre, year=2001)
+            for author in ("Tolstoy", "Tolstoyevich", "Tolstoyevich Markov")
+        ]
+        params = {"author": "tolstoy", "fuzzy": "1", "page_size": 2}
+        first = self.client.get(self.url, params).json()
+        self.assertIsNone(first["previous"])
+        second = self.client.get(first["next"]).json()
+        self.assertIsNone(second["next"])
+        self.assertEqual(self.ids(first) + self.ids(second), [str(book.pk) for book in books])
+        self.assertEqual(self.ids(self.client.get(second["previous"]).json()), self.ids(first))
+
+
+class ImageVariantUrlTests(SimpleTestCase):
+    def test_missing_variants_fall_back_to_original(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        with self.settings(MEDIA_ROOT=media.name, MEDIA_URL="/media/"):
+            urls = image_variant_urls("book/image/cover.png")
+            self.assertEqual(urls["thumb"], {"webp": "/media/book/image/cover.png", "jpg": "/media/book/image/cover.png"})
+
+            path = os.path.join(media.name, variant_name("book/image/cover.png", "thumb", "webp"))
+            os.makedirs(os.path.dirname(path))
+            open(path, "wb").close()
+            # The miss is remembered until the render task reports back.
+            urls = image_variant_urls("book/image/cover.png")
+            self.assertEqual(urls["thumb"]["webp"], "/media/book/image/cover.png")
+
+            forget_missing_variants("book/image/cover.png", settings.BOOK_IMAGE_VARIANTS)
+            urls = image_variant_urls("book/image/cover.png")
+            self.assertEqual(urls["thumb"]["webp"], "/media/book/image/variants/cover_thumb.webp")
+            self.assertEqual(urls["thumb"]["jpg"], "/media/book/image/cover.png")
+
+    def test_missing_variants_are_checked_again_after_ttl(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        storage = FileSystemStorage(location=media.name)
+        name = variant_name("book/image/ttl.png", "thumb", "webp")
+        with mock.patch.object(storage, "exists", wraps=storage.exists) as exists:
+            self.assertFalse(variant_exists(storage, name, missing_ttl=30))
+            self.assertFalse(variant_exists(storage, name, missing_ttl=30))
+            self.assertEqual(exists.call_count, 1)
+
+            os.makedirs(os.path.dirname(storage.path(name)))
+            open(storage.path(name), "wb").close()
+            with mock.patch("library.images.time.monotonic", return_value=time.monotonic() + 31):
+                self.assertTrue(variant_exists(storage, name, missing_ttl=30))
+            self.assertEqual(exists.call_count, 2)
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN="scrape-token", METRICS_ALLOWED_IPS=["10.0.0.5"])
+class MetricsAccessTests(TestCase):
+    def test_requires_token_allowed_address_or_staff(self):
+        remote = {"REMOTE_ADDR": "203.0.113.9"}
+        self.assertEqual(self.client.get("/metrics", **remote).status_code, 403)
+        self.assertEqual(
+            self.client.get("/metrics", headers={"Authorization": "Bearer wrong"}, **remote).status_code, 403,
+        )
+        self.assertEqual(
+            self.client.get("/metrics", headers={"Authorization": "Bearer scrape-token"}, **remote).status_code, 200,
+        )
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.5").status_code, 200)
+
+        self.client.force_login(UserModel.objects.create_user(email="staff@example.com", is_staff=True))
+        self.assertEqual(self.client.get("/metrics", **remote).status_code, 200)
+
+
+class SearchRequestDeduplicationTests(TestCase):
+    def test_duplicates_are_removed_before_constraint_is_added(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ALTER TABLE search_request DROP CONSTRAINT search_request_query_language_uniq")
+        for keywords in (["old"], ["older"], ["new"]):
+            SearchRequestModel.objects.create(query="war", language="en", keywords=keywords)
+        SearchRequestModel.objects.create(query="war", language="uz", keywords=["urush"])
+        newest = SearchRequestModel.objects.filter(language="en").latest("updated_at")
+
+        deduplicate_search_requests()
+
+        self.assertEqual(
+            sorted(SearchRequestModel.objects.values_list("language", "keywords")),
+            [("en", newest.keywords), ("uz", ["urush"])],
+        )
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "Full-text search is PostgreSQL specific")
+class KeywordSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalog(genres=5, books=2000, seed=6)
+        poetry = GenreModel.objects.create(name="Poetry", name_en="Poetry")
+        dragons = GenreModel.objects.create(name="Dragon tales", name_en="Dragon tales")
+
+        def book(title, description, genre):
+            return BookModel.objects.create(
+                title_en=title, author_en="Ann Writer", description_en=description, genre=genre, year=2001,
+            )
+
+        cls.title_hit = book("The dragon keeper", "A quiet village.", poetry)
+        cls.description_hit = book("Mountain winter", "A dragon sleeps under the hill.", poetry)
+        cls.genre_hit = book("Silent lake", "Nothing happens.", dragons)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE book")
+
+    def setUp(self):
+        genre_index.invalidate()
+
+    def test_matches_search_vector_or_genre(self):
+        books = keyword_books(BookModel.objects.all(), ["dragon"], "en", query="dragon")[:50]
+        self.assertEqual(set(books), {self.title_hit, self.description_hit, self.genre_hit})
+
+    def test_title_outranks_genre_and_genre_outranks_description(self):
+        # Title (A) > genre match (GENRE_WEIGHT) > description (D).
+        books = list(keyword_books(BookModel.objects.all(), ["dragon"], "en", query="dragon")[:50])
+        self.assertEqual(books, [self.title_hit, self.genre_hit, self.description_hit])
+        self.assertGreater(books[0].relevance, books[1].relevance)
+        self.assertGreater(books[1].relevance, books[2].relevance)
+
+    def test_raw_query_words_outrank_ai_keywords(self):
+        # Both are title hits for the keywords; the user's own word decides.
+        books = list(keyword_books(BookModel.objects.all(), ["keeper", "winter"], "en", query="winter")[:50])
+        self.assertEqual(books, [self.description_hit, self.title_hit])
+
+    def test_uses_search_and_genre_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = keyword_books(BookModel.objects.all(), ["dragon"], "en", query="dragon")[:50].explain()
+        self.assertIn("book_search_en_gin", plan)
+        self.assertIn("BitmapOr", plan)
+        self.assertNotIn("Seq Scan", plan)
+
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        poetry = GenreModel.objects.create(name_en="Poetry", name_uz="She'riyat")
+        self.book = BookModel.objects.create(
+            title_en="Love river", title_uz="Sevgi daryosi", author_en="Ann Rivers", author_uz="Anna Rivers",
+            genre=poetry, year=2001,
+        )
+        self.index = AutocompleteIndex(
+            languages=["uz", "ru", "en"], refresh_interval=600, min_rebuild_interval=60, history_days=30,
+        )
+
+    def texts(self, prefix, language):
+        return [suggestion["text"] for suggestion in self.index.suggest(prefix, language)]
+
+    def test_matches_prefix_of_any_word(self):
+        self.index._build()
+        self.assertEqual(self.texts("riv", "en"), ["Ann Rivers", "Love river"])
+        self.assertEqual(self.texts("LOVE R", "en"), ["Love river"])
+        self.assertEqual(self.texts("poe", "en"), ["Poetry"])
+        self.assertEqual(self.texts("xyz", "en"), [])
+
+    def test_suggests_in_the_requested_language(self):
+        self.index._build()
+        self.assertEqual(self.texts("sev", "uz"), ["Sevgi daryosi"])
+        self.assertEqual(self.texts("sev", "en"), [])
+        self.assertEqual(self.texts("she'", "uz"), ["She'riyat"])
+
+    def test_saved_book_is_reindexed(self):
+        self.index._build()
+        with mock.patch("library.signals.autocomplete_index", self.index):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.book.title_en = "Winter garden"
+                self.book.save()
+        self.assertEqual(self.texts("love", "en"), [])
+        self.assertEqual(self.texts("gard", "en"), ["Winter garden"])
+
+    def test_falls_back_to_database_until_built(self):
+        with mock.patch.object(self.index, "warm") as warm:
+            suggestions = self.index.suggest("lov", "en")
+        warm.assert_called_once_with()
+        self.assertEqual(suggestions, [{"text": "Love river", "type": "title", "id": str(self.book.pk)}])
+        with mock.patch.object(self.index, "warm"):
+            self.assertEqual(self.texts("ann", "en"), ["Ann Rivers"])
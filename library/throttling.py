@@ -0,0 +1,104 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+# Serializes the read-modify-write of bucket state within a process; two
+# processes racing on one key can let an extra request through, which is fine
+# for protecting a quota.
+_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    # "20/min" -> tokens per second, in the same notation as DRF's rates.
+    count, period = rate.split("/")
+    seconds = {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+    return int(count) / seconds
+
+
+class TokenBucket:
+    # `burst` tokens refilled at `rate` per second, stored as (tokens,
+    # updated) under `key`. Unlike DRF's SimpleRateThrottle it keeps no
+    # timestamp per request, and it allows short bursts while holding the
+    # long-run rate.
+
+    def __init__(self, cache, key, rate, burst):
+        self.cache = cache
+        self.key = key
+        self.rate = rate
+        self.burst = max(1, burst)
+        # After this long an untouched bucket is full again, so the entry can
+        # simply expire.
+        self.timeout = math.ceil(self.burst / self.rate) + 1
+
+    def take(self):
+        # Returns None when a token was taken, otherwise the seconds until
+        # one is available.
+        with _lock:
+            tokens, now = self._refilled()
+            if tokens < 1:
+                self.cache.set(self.key, (tokens, now), self.timeout)
+                return (1 - tokens) / self.rate
+            self.cache.set(self.key, (tokens - 1, now), self.timeout)
+            return None
+
+    def give_back(self):
+        with _lock:
+            tokens, now = self._refilled()
+            self.cache.set(self.key, (min(self.burst, tokens + 1), now), self.timeout)
+
+    def _refilled(self):
+        now = time.time()
+        tokens, updated = self.cache.get(self.key, (self.burst, now))
+        return min(self.burst, tokens + max(0.0, now - updated) * self.rate), now
+
+
+class SearchThrottle(BaseThrottle):
+    # A bucket per user and one shared by all users, which keeps the total
+    # search rate, and so the Gemini calls it can cause, under the API quota.
+    #
+    # The buckets are taken in that order and the first empty one rejects the
+    # request, so a user over their own limit never reaches the shared bucket
+    # and cannot starve everyone else. A token already taken from the user's
+    # bucket is given back when the shared one rejects.
+    #
+    # The state lives in the shared library cache so every worker draws from
+    # the same buckets.
+    cache_prefix = "library:throttle:search"
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def get_buckets(self, request):
+        cache = caches[settings.LIBRARY_CACHE_ALIAS]
+        if request.user and request.user.is_authenticated:
+            ident = f"user:{request.user.pk}"
+        else:
+            ident = f"ip:{self.get_ident(request)}"
+        return [
+            TokenBucket(cache, f"{self.cache_prefix}:{ident}",
+                        parse_rate(settings.SEARCH_THROTTLE_USER_RATE), settings.SEARCH_THROTTLE_USER_BURST),
+            TokenBucket(cache, f"{self.cache_prefix}:global",
+                        parse_rate(settings.SEARCH_THROTTLE_GLOBAL_RATE), settings.SEARCH_THROTTLE_GLOBAL_BURST),
+        ]
+
+    def allow_request(self, request, view):
+        taken = []
+        for bucket in self.get_buckets(request):
+            wait = bucket.take()
+            if wait is not None:
+                for earlier in taken:
+                    earlier.give_back()
+                self.wait_seconds = wait
+                return False
+            taken.append(bucket)
+        return True
+
+    def wait(self):
+        return self.wait_seconds
+
+
+SEARCH_THROTTLES = [SearchThrottle]
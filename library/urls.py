@@ -1,9 +1,16 @@
 from django.urls import path
-from .views import BookViewSet, SearchHistoryViewSet, BookSearchViewSet
+from .views import (
+    AsyncBookSearchView, AutocompleteViewSet, BookSearchViewSet, BookViewSet, PopularSearchesViewSet,
+    SearchHistoryViewSet,
+)
 
 urlpatterns = [
     path("books/", BookViewSet.as_view({"get": "list"}), name="book-list"),
+    path("books/export/", BookViewSet.as_view({"get": "export"}), name="book-export"),
     path("books/<uuid:pk>/", BookViewSet.as_view({"get": "retrieve"}), name="book-detail"),
+    path("autocomplete/", AutocompleteViewSet.as_view({"get": "list"}), name="autocomplete"),
     path('search-history/', SearchHistoryViewSet.as_view({"get": "list"}), name="search-history"),
+    path("search/popular/", PopularSearchesViewSet.as_view({"get": "list"}), name="popular-searches"),
     path("search/", BookSearchViewSet.as_view({"post": "create"}), name="book-search"),
+    path("search/async/", AsyncBookSearchView.as_view(), name="book-search-async"),
 ]
@@ -1,39 +1,116 @@
+import asyncio
 import logging
-from typing import List
+import threading
+import time
+from typing import List, Tuple
 from asgiref.sync import async_to_sync
-import google.generativeai as genai
-from config.settings import GEMINI_API_KEY
+from django.conf import settings
+from core.metrics import add_request_time
+from .circuit_breaker import CircuitBreaker
+from .keyword_cache import keyword_cache, normalize_query
+from .keywords import extract_keywords
+from .single_flight import SingleFlight
 
-genai.configure(api_key=GEMINI_API_KEY)
+gemini_breaker = CircuitBreaker(
+    failure_threshold=settings.GEMINI_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=settings.GEMINI_BREAKER_RESET_TIMEOUT,
+    slow_call_threshold=settings.GEMINI_SLOW_CALL_THRESHOLD,
+)
+keyword_requests = SingleFlight()
 
+# google.generativeai pulls in grpc and protobuf, close to a second of import
+# time that management commands, migrations and workers which never search
+# should not pay. It is imported and configured on the first Gemini call;
+# the models (one per answer language) are kept for the later calls.
+_gemini_models = {}
+_gemini_lock = threading.Lock()
 
-async def _ai_search_books_async(query: str, language: str = "uz") -> List[str]:
-    try:
-        system_instruction = (
-            "Siz kutubxona qidiruv yordamchisisiz. Foydalanuvchi tabiiy tilda kitob qidiryapti. "
-            "Ularning so'rovini tahlil qilib, qidiruv uchun kalit so'zlarni ajratib bering. "
-            "Faqat kalit so'zlarni vergul bilan ajratib qaytaring. Boshqa hech narsa yozmang. "
-            "Misol: \"men romantik kitob izlayapman\" -> \"romantika, sevgi, munosabat\". "
-            f"Javob tili: {language}."
-        )
 
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-flash",
-            system_instruction=system_instruction
-        )
+def _gemini_model(language: str):
+    with _gemini_lock:
+        model = _gemini_models.get(language)
+        if model is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=settings.GEMINI_API_KEY)
+            model = _gemini_models[language] = genai.GenerativeModel(
+                model_name="gemini-2.5-flash",
+                system_instruction=_system_instruction(language),
+            )
+        return model
+
+
+def _system_instruction(language: str) -> str:
+    return (
+        "Siz kutubxona qidiruv yordamchisisiz. Foydalanuvchi tabiiy tilda kitob qidiryapti. "
+        "Ularning so'rovini tahlil qilib, qidiruv uchun kalit so'zlarni ajratib bering. "
+        "Faqat kalit so'zlarni vergul bilan ajratib qaytaring. Boshqa hech narsa yozmang. "
+        "Misol: \"men romantik kitob izlayapman\" -> \"romantika, sevgi, munosabat\". "
+        f"Javob tili: {language}."
+    )
+
+
+async def _load_gemini_model(language: str):
+    model = _gemini_models.get(language)
+    if model is None:
+        # The first call imports the SDK; keep that off the event loop.
+        model = await asyncio.to_thread(_gemini_model, language)
+    return model
+
+
+async def _gemini_keywords_async(model, query: str) -> List[str]:
+    prompt = f"Foydalanuvchi so'rovi: {query}\n\nFaqat kalit so'zlarni vergul bilan ajratib yozing."
+
+    response = await model.generate_content_async(prompt)
+    text = response.text.strip() if response.text else ""
 
-        prompt = f"Foydalanuvchi so'rovi: {query}\n\nFaqat kalit so'zlarni vergul bilan ajratib yozing."
+    return [k.strip() for k in text.split(",") if k.strip()]
 
-        response = await model.generate_content_async(prompt)
-        text = response.text.strip() if response.text else ""
 
-        keywords = [k.strip() for k in text.split(",") if k.strip()]
-        return keywords or [query]
+# Returns (keywords, source) where source is "cache", "ai" or "local". The local
+# extractor takes over while the breaker is open or when Gemini fails or misses
+# its deadline, so the call never takes much longer than GEMINI_TIMEOUT.
+# Concurrent identical searches share one lookup (and at most one Gemini call).
+async def _ai_search_books_async(query: str, language: str = "uz") -> Tuple[List[str], str]:
+    return await keyword_requests.do((normalize_query(query), language), _resolve_keywords_async, query, language)
 
+
+async def _resolve_keywords_async(query: str, language: str) -> Tuple[List[str], str]:
+    cached = await keyword_cache.aget(query, language)
+    if cached is not None:
+        return cached, "cache"
+
+    # Loaded before the breaker and the timed section: the cold SDK import is
+    # not Gemini being slow and must not count against GEMINI_TIMEOUT.
+    try:
+        model = await _load_gemini_model(language)
+    except Exception as e:
+        logging.error(f"AI search error (Gemini SDK): {e!r}")
+        return extract_keywords(query, language), "local"
+
+    if not gemini_breaker.allow():
+        return extract_keywords(query, language), "local"
+
+    started = time.monotonic()
+    try:
+        keywords = await asyncio.wait_for(
+            _gemini_keywords_async(model, query), timeout=settings.GEMINI_TIMEOUT,
+        )
     except Exception as e:
-        logging.error(f"AI search error (Gemini): {e}")
-        return [query]
+        add_request_time("gemini_seconds", time.monotonic() - started)
+        gemini_breaker.record_failure()
+        logging.error(f"AI search error (Gemini): {e!r}")
+        return extract_keywords(query, language), "local"
+    elapsed = time.monotonic() - started
+    add_request_time("gemini_seconds", elapsed)
+    gemini_breaker.record_success(elapsed)
+
+    if not keywords:
+        return extract_keywords(query, language), "local"
+
+    await keyword_cache.aset(query, language, keywords)
+    return keywords, "ai"
 
 
-def ai_search_books(query: str, language: str = "uz") -> List[str]:
-    return async_to_sync(_ai_search_books_async)(query=query, language=language)
\ No newline at end of file
+def ai_search_books(query: str, language: str = "uz") -> Tuple[List[str], str]:
+    return async_to_sync(_ai_search_books_async)(query=query, language=language)
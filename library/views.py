@@ -1,12 +1,44 @@
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Q
-from rest_framework import status, viewsets
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status, viewsets
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from .autocomplete import autocomplete_index
+from .export import aiter_ndjson, iter_ndjson
+from .genres import genre_index
+from .history import search_history_buffer
 from .models import BookModel, SearchHistory
-from .serializers import BookSerializer, SearchHistorySerializer, SearchRequestSerializer
-from .utils import ai_search_books
+from .pagination import BookCursorPagination, BookRankedPagination
+from .conditional import detail_validators, list_validators, not_modified_response, set_validators
+from .response_cache import get_response_cache, request_fingerprint, response_cache_key
+from .search import fuzzy_filter, keyword_books, search_books, semantic_books
+from .search_stats import popular_searches
+from .throttling import SEARCH_THROTTLES
+from .serializers import (
+    BookRowSerializer, BookSerializer, SearchHistorySerializer, SearchRequestSerializer, get_lang_from_request,
+)
+from .utils import _ai_search_books_async, ai_search_books
+
+
+def merge_query_keywords(query, keywords):
+    keywords = list(keywords or [])
+    normalized_query = query.strip()
+    if normalized_query and normalized_query not in keywords:
+        keywords.insert(0, normalized_query)
+    return keywords
 
 
 class BookViewSet(viewsets.ViewSet):
@@ -19,8 +51,14 @@ class BookViewSet(viewsets.ViewSet):
                 "- genre: search by genre name (matches Genre.name_uz/name_ru/name_en)\n"
                 "- year: filter by publication year\n"
                 "- language: filter by book language (BookModel.language: en/ru/uz)\n"
-                "- search: full-text search across title_* and author_* fields\n"
-                "- lang: controls the response language (used by modeltranslation in the serializer)"
+                "- search: full-text search (websearch syntax) across title_*, author_* and description_* fields\n"
+                "- fuzzy: set to 1 to match author/genre by trigram similarity (tolerates typos) "
+                "and order results by closeness\n"
+                "- lang: controls the response language (used by modeltranslation in the serializer)\n\n"
+                "Pagination (optional): pass page_size and/or cursor to get a cursor-paginated response "
+                "ordered by newest first. The response then contains next/previous cursor links and results.\n\n"
+                "Responses carry an ETag header; send it back as If-None-Match to get a 304 when nothing "
+                "in the result set has changed (including books removed from it)."
         ),
         manual_parameters=[
             openapi.Parameter(
@@ -55,7 +93,14 @@ class BookViewSet(viewsets.ViewSet):
                 name="search",
                 in_=openapi.IN_QUERY,
                 type=openapi.TYPE_STRING,
-                description="Full-text search across title_* and author_* fields.",
+                description="Full-text search across title_*, author_* and description_* fields.",
+                required=False,
+            ),
+            openapi.Parameter(
+                name="fuzzy",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_BOOLEAN,
+                description="Use similarity-ranked fuzzy matching for the author and genre filters.",
                 required=False,
             ),
             openapi.Parameter(
@@ -65,30 +110,82 @@ class BookViewSet(viewsets.ViewSet):
                 description="Controls the response language (uz/ru/en).",
                 required=False,
             ),
+            openapi.Parameter(
+                name="page_size",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Enables cursor pagination with the given page size (capped by the server).",
+                required=False,
+            ),
+            openapi.Parameter(
+                name="cursor",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Opaque cursor taken from the next/previous link of a paginated response.",
+                required=False,
+            ),
+            openapi.Parameter(
+                name="offset",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description=(
+                    "Fuzzy results are ranked by similarity and paged by offset instead of a cursor; "
+                    "follow the next/previous links."
+                ),
+                required=False,
+            ),
         ],
         responses={200: BookSerializer(many=True)},
         tags=["Books"],
     )
     def list(self, request):
-        queryset = BookModel.objects.select_related("genre").all()
+        lang, lang_options = get_lang_from_request(request)
+        cache = get_response_cache()
+        cache_key = response_cache_key(request, "book-list", lang)
+        cached = cache.get(cache_key)
+        if cached is None:
+            queryset = self.filter_books(request)
+            validators = list_validators(queryset, request_fingerprint(request, lang))
+        else:
+            validators = cached["validators"]
+
+        not_modified = not_modified_response(request, validators)
+        if not_modified is not None:
+            return set_validators(not_modified, validators)
+
+        if cached is None:
+            cached = {"data": self.list_data(request, queryset, lang), "validators": validators}
+            cache.set(cache_key, cached)
+        return set_validators(Response(cached["data"], status=status.HTTP_200_OK), validators)
+
+    def filter_books(self, request):
+        queryset = BookModel.objects.all()
         search = request.query_params.get("search")
         author = request.query_params.get("author")
         genre = request.query_params.get("genre")
         year = request.query_params.get("year")
         language = request.query_params.get("language")
-        if author:
+        fuzzy = request.query_params.get("fuzzy") in ("1", "true")
+        similarity_ordering = []
+        if author and fuzzy:
+            queryset = fuzzy_filter(
+                queryset, author, ["author_uz", "author_ru", "author_en"], "author_similarity"
+            )
+            similarity_ordering.append("-author_similarity")
+        elif author:
             queryset = queryset.filter(
                 Q(author_uz__icontains=author)
                 | Q(author_ru__icontains=author)
                 | Q(author_en__icontains=author)
             )
 
-        if genre:
-            queryset = queryset.filter(
-                Q(genre__name_uz__icontains=genre)
-                | Q(genre__name_ru__icontains=genre)
-                | Q(genre__name_en__icontains=genre)
+        if genre and fuzzy:
+            queryset = fuzzy_filter(
+                queryset, genre, ["genre__name_uz", "genre__name_ru", "genre__name_en"], "genre_similarity"
             )
+            similarity_ordering.append("-genre_similarity")
+        elif genre:
+            queryset = queryset.filter(genre_id__in=genre_index.ids_matching(genre))
 
         if year:
             queryset = queryset.filter(year=int(year))
@@ -96,22 +193,32 @@ class BookViewSet(viewsets.ViewSet):
         if language:
             queryset = queryset.filter(language=language)
         if search:
-            search_queryset = (
-                    Q(title_uz__icontains=search)
-                    | Q(title_ru__icontains=search)
-                    | Q(title_en__icontains=search)
-                    | Q(author_uz__icontains=search)
-                    | Q(author_ru__icontains=search)
-                    | Q(author_en__icontains=search)
-            )
-            queryset = queryset.filter(search_queryset)
-        queryset = queryset.distinct()
-        serializer = BookSerializer(queryset, many=True, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+            queryset = search_books(queryset, search)
+        if similarity_ordering:
+            queryset = queryset.order_by(*similarity_ordering)
+        # Every filter is on the book row or its forward genre foreign key, so
+        # no row can repeat and the query needs no DISTINCT.
+        return queryset
+
+    def list_data(self, request, queryset, lang):
+        rows = BookRowSerializer.book_rows(queryset, lang)
+        # filter_books only orders the queryset for fuzzy (similarity) matches.
+        paginator = BookRankedPagination() if queryset.query.order_by else BookCursorPagination()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(rows, request, view=self)
+            serializer = BookRowSerializer(page, many=True, context={"request": request})
+            return paginator.get_paginated_response(list(serializer.data)).data
+
+        serializer = BookRowSerializer(rows, many=True, context={"request": request})
+        return list(serializer.data)
 
     @swagger_auto_schema(
         operation_summary="Retrieve a book",
-        operation_description="Get a single book by ID.",
+        operation_description=(
+                "Get a single book by ID.\n\n"
+                "Responses carry ETag and Last-Modified headers; send them back as If-None-Match / "
+                "If-Modified-Since to get a 304 when the book has not changed."
+        ),
         responses={
             200: BookSerializer(),
             404: "Not Found",
@@ -119,15 +226,55 @@ class BookViewSet(viewsets.ViewSet):
         tags=["Books"],
     )
     def retrieve(self, request, pk=None):
-        book = BookModel.objects.filter(id=pk).first()
-        if not book:
-            return Response(
-                data={"message": "Book not found"},
-                status=status.HTTP_404_NOT_FOUND,
-            )
+        lang, lang_options = get_lang_from_request(request)
+        cache = get_response_cache()
+        cache_key = response_cache_key(request, "book-detail", lang, pk=str(pk))
+        cached = cache.get(cache_key)
+        if cached is None:
+            queryset = BookModel.objects.filter(id=pk)
+            validators = detail_validators(queryset, request_fingerprint(request, lang, pk=str(pk)))
+            if validators is None:
+                return Response(
+                    data={"message": "Book not found"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+        else:
+            validators = cached["validators"]
+
+        not_modified = not_modified_response(request, validators)
+        if not_modified is not None:
+            return set_validators(not_modified, validators)
+
+        if cached is None:
+            book = queryset.select_related("genre").first()
+            if not book:
+                return Response(
+                    data={"message": "Book not found"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+            data = dict(BookSerializer(book, context={"request": request}).data)
+            cached = {"data": data, "validators": validators}
+            cache.set(cache_key, cached)
+        return set_validators(Response(cached["data"], status=status.HTTP_200_OK), validators)
 
-        serializer = BookSerializer(book, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_summary="Export the book catalog",
+        operation_description=(
+                "Streams every book as newline-delimited JSON (one object per line) with all translations "
+                "and the genre names. Intended for partners mirroring the catalog; the response starts "
+                "immediately and is not buffered in memory."
+        ),
+        responses={200: "application/x-ndjson stream"},
+        tags=["Books"],
+    )
+    def export(self, request):
+        # The view itself runs in a thread under ASGI too, but the response is
+        # sent from the event loop and needs an async iterator to stream.
+        content = aiter_ndjson() if isinstance(request._request, ASGIRequest) else iter_ndjson()
+        response = StreamingHttpResponse(content, content_type="application/x-ndjson; charset=utf-8")
+        response["Content-Disposition"] = 'attachment; filename="books.ndjson"'
+        return response
 
 
 class SearchHistoryViewSet(viewsets.ViewSet):
@@ -140,20 +287,162 @@ class SearchHistoryViewSet(viewsets.ViewSet):
         tags=["Books"],
     )
     def list(self, request):
-        queryset = SearchHistory.objects.filter(user=request.user).order_by("-created_at")[:20]
+        queryset = (
+            SearchHistory.objects.filter(user=request.user)
+            .only("id", "query", "created_at")
+            .order_by("-created_at")[:20]
+        )
         serializer = SearchHistorySerializer(queryset, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class AutocompleteViewSet(viewsets.ViewSet):
+    @swagger_auto_schema(
+        operation_summary="Autocomplete",
+        operation_description=(
+                "Suggests book titles, authors and genre names that start with the typed text (or have a word "
+                "that does), in the response language, most searched first. Served from an in-memory index, "
+                "so it is cheap enough to call on every keystroke."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                name="q",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Text typed so far.",
+                required=True,
+            ),
+            openapi.Parameter(
+                name="limit",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Maximum number of suggestions (capped by the server).",
+                required=False,
+            ),
+            openapi.Parameter(
+                name="lang",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Suggestion language (uz/ru/en).",
+                required=False,
+            ),
+        ],
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "query": openapi.Schema(type=openapi.TYPE_STRING),
+                    "suggestions": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_OBJECT),
+                    ),
+                },
+            ),
+        },
+        tags=["Books"],
+    )
+    def list(self, request):
+        lang, lang_options = get_lang_from_request(request)
+        query = request.query_params.get("q", "")
+        try:
+            limit = int(request.query_params.get("limit", settings.AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            limit = settings.AUTOCOMPLETE_LIMIT
+        limit = max(1, min(limit, settings.AUTOCOMPLETE_MAX_LIMIT))
+        return Response(
+            {"query": query, "suggestions": autocomplete_index.suggest(query, lang, limit)},
+            status=status.HTTP_200_OK,
+        )
+
+
+class PopularSearchesViewSet(viewsets.ViewSet):
+    @swagger_auto_schema(
+        operation_summary="Popular searches",
+        operation_description=(
+                "Most frequent search queries in the given language over the last `days` days, read from an "
+                "hourly/daily rollup that is updated as searches are recorded (so the cost does not depend on "
+                "how much search history exists). Responses are cached for a short time."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                name="lang",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Search language (uz/ru/en).",
+                required=False,
+            ),
+            openapi.Parameter(
+                name="days",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Time window in days (capped by the stats retention).",
+                required=False,
+            ),
+            openapi.Parameter(
+                name="limit",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                description="Maximum number of queries (capped by the server).",
+                required=False,
+            ),
+        ],
+        responses={
+            200: openapi.Schema(
+                type=openapi.TYPE_OBJECT,
+                properties={
+                    "language": openapi.Schema(type=openapi.TYPE_STRING),
+                    "days": openapi.Schema(type=openapi.TYPE_INTEGER),
+                    "results": openapi.Schema(
+                        type=openapi.TYPE_ARRAY,
+                        items=openapi.Items(type=openapi.TYPE_OBJECT),
+                    ),
+                },
+            ),
+        },
+        tags=["Books"],
+    )
+    def list(self, request):
+        lang, lang_options = get_lang_from_request(request)
+        days = self.int_param(request, "days", settings.POPULAR_SEARCHES_DAYS, settings.SEARCH_STATS_RETENTION_DAYS)
+        limit = self.int_param(request, "limit", settings.POPULAR_SEARCHES_LIMIT, settings.POPULAR_SEARCHES_MAX_LIMIT)
+
+        cache = get_response_cache()
+        cache_key = f"library:popular-searches:{lang}:{days}:{limit}"
+        data = cache.get(cache_key)
+        if data is None:
+            data = {"language": lang, "days": days, "results": popular_searches(lang, days, limit)}
+            cache.set(cache_key, data, timeout=settings.POPULAR_SEARCHES_CACHE_TIMEOUT)
+        return Response(data, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def int_param(request, name, default, maximum):
+        try:
+            value = int(request.query_params.get(name, default))
+        except ValueError:
+            value = default
+        return max(1, min(value, maximum))
+
+
 class BookSearchViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
+    throttle_classes = SEARCH_THROTTLES
 
     @swagger_auto_schema(
         operation_summary="Search books using AI",
         operation_description=(
                 "Takes a natural language query from the user, extracts search keywords using AI (Gemini), "
-                "then searches the Book model by these keywords and returns the results. "
-                "Also saves the user's search query into the SearchHistory table."
+                "then searches the Book model by these keywords and returns the 50 most relevant results "
+                "(title matches rank above author, genre and description matches, and words of the query itself "
+                "above AI keywords). "
+                "Also saves the user's search query into the SearchHistory table (written in batches, "
+                "so it can take a couple of seconds to appear in the search history).\n\n"
+                "keywords_source tells which path produced the keywords: cache (a previous AI answer), "
+                "ai (a fresh Gemini call) or local (the built-in extractor, used when Gemini is slow or unavailable).\n\n"
+                "mode=semantic skips keyword extraction and ranks books by similarity of the query to their title "
+                "and description using the local semantic index (no network calls); keywords is then empty and "
+                "keywords_source is semantic.\n\n"
+                "Requests are rate limited per user and across all users; a 429 response carries a Retry-After "
+                "header. Identical concurrent searches share a single keyword lookup."
         ),
         request_body=SearchRequestSerializer,
         responses={
@@ -166,6 +455,7 @@ class BookSearchViewSet(viewsets.ViewSet):
                         type=openapi.TYPE_ARRAY,
                         items=openapi.Items(type=openapi.TYPE_STRING),
                     ),
+                    "keywords_source": openapi.Schema(type=openapi.TYPE_STRING, enum=["cache", "ai", "local", "semantic"]),
                     "results": openapi.Schema(
                         type=openapi.TYPE_ARRAY,
                         items=openapi.Items(type=openapi.TYPE_OBJECT),
@@ -173,6 +463,7 @@ class BookSearchViewSet(viewsets.ViewSet):
                 },
             ),
             400: "Bad Request",
+            429: "Too Many Requests",
             500: "Server Error",
         },
         tags=["Books"]
@@ -185,48 +476,128 @@ class BookSearchViewSet(viewsets.ViewSet):
         language = serializer.validated_data["language"]
 
         try:
-            keywords = ai_search_books(query=query, language=language) or []
+            if serializer.validated_data["mode"] == "semantic":
+                keywords, keywords_source = [], "semantic"
+                books_qs = semantic_books(BookModel.objects.select_related("genre"), query, language)
+            else:
+                keywords, keywords_source = ai_search_books(query=query, language=language)
+                keywords = merge_query_keywords(query, keywords)
+                books_qs = keyword_books(
+                    BookModel.objects.select_related("genre"), keywords, language, query=query,
+                )[:50]
+            results = BookSerializer(books_qs, many=True).data
 
-            normalized_query = query.strip()
-            if normalized_query and normalized_query not in keywords:
-                keywords.insert(0, normalized_query)
+            if request.user.is_authenticated:
+                search_history_buffer.add(user_id=request.user.id, query=query, language=language)
 
-            fields = [
-                f"title_{language}",
-                f"author_{language}",
-                f"description_{language}",
-                f"genre__name_{language}"
-            ]
+            return Response(
+                {
+                    "query": query,
+                    "language": language,
+                    "keywords": keywords,
+                    "keywords_source": keywords_source,
+                    "results": results,
+                },
+                status=status.HTTP_200_OK,
+            )
 
-            q_obj = Q()
-            for kw in keywords:
-                kw_filter = Q()
-                for field in fields:
-                    kw_filter |= Q(**{f"{field}__icontains": kw})
-                q_obj |= kw_filter
+        except Exception as e:
+            return Response(
+                {"detail": "Internal server error", "error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
 
 
-            books_qs = BookModel.objects.filter(q_obj).distinct()[:50]
-            results = BookSerializer(books_qs, many=True).data
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncBookSearchView(View):
+    # Same contract as BookSearchViewSet.create, but the Gemini call and the
+    # ORM work are awaited, so under ASGI a slow LLM response does not hold a
+    # worker thread.
+    http_method_names = ["post"]
 
-            if request.user.is_authenticated:
-                SearchHistory.objects.create(
-                    user=request.user,
-                    query=query,
+    async def post(self, request, *args, **kwargs):
+        try:
+            drf_request = await sync_to_async(self.authenticate)(request)
+            user = drf_request.user
+        except exceptions.APIException as e:
+            data = e.detail if isinstance(e.detail, dict) else {"detail": e.detail}
+            return JsonResponse(data, status=e.status_code)
+        if not user or not user.is_authenticated:
+            return JsonResponse(
+                {"detail": "Authentication credentials were not provided."},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+
+        wait = await sync_to_async(self.check_throttles)(drf_request)
+        if wait is not False:
+            throttled = exceptions.Throttled(wait)
+            response = JsonResponse({"detail": throttled.detail}, status=throttled.status_code)
+            if wait is not None:
+                response["Retry-After"] = str(math.ceil(wait))
+            return response
+
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error"}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = SearchRequestSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        query = serializer.validated_data["query"]
+        language = serializer.validated_data["language"]
+
+        try:
+            if serializer.validated_data["mode"] == "semantic":
+                keywords, keywords_source = [], "semantic"
+                books = await sync_to_async(semantic_books)(
+                    BookModel.objects.select_related("genre"), query, language,
                 )
+            else:
+                keywords, keywords_source = await _ai_search_books_async(query=query, language=language)
+                keywords = merge_query_keywords(query, keywords)
+                # keyword_books can load the genre index from the database.
+                books_qs = await sync_to_async(keyword_books)(
+                    BookModel.objects.select_related("genre"), keywords, language, query=query,
+                )
+                books = [book async for book in books_qs[:50]]
+            results = BookSerializer(books, many=True).data
 
-            return Response(
+            await search_history_buffer.aadd(user_id=user.id, query=query, language=language)
+
+            return JsonResponse(
                 {
                     "query": query,
                     "language": language,
                     "keywords": keywords,
+                    "keywords_source": keywords_source,
                     "results": results,
                 },
                 status=status.HTTP_200_OK,
+                json_dumps_params={"ensure_ascii": False},
             )
 
         except Exception as e:
-            return Response(
+            return JsonResponse(
                 {"detail": "Internal server error", "error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+
+    def authenticate(self, request):
+        drf_request = Request(
+            request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+        )
+        # Accessing .user runs the authenticators here, in the sync thread.
+        drf_request.user
+        return drf_request
+
+    def check_throttles(self, drf_request):
+        # Same throttles as BookSearchViewSet, stopping at the first one that
+        # rejects. Returns False when the request may go ahead, otherwise the
+        # seconds to wait (None if unknown).
+        for throttle_class in SEARCH_THROTTLES:
+            throttle = throttle_class()
+            if not throttle.allow_request(drf_request, self):
+                return throttle.wait()
+        return False